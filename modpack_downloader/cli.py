@@ -0,0 +1,455 @@
+"""
+Headless command line interface, runs the resolve -> download pipeline without Qt
+
+    python -m modpack_downloader cf ./pack.zip -o ./instances
+    python -m modpack_downloader cf-online all-the-mods-9 5125809 -o ./instances
+    python -m modpack_downloader ftb 35 6287 -o ./instances --json
+    python -m modpack_downloader mr ./pack.mrpack -o ./instances
+    python -m modpack_downloader batch ./packs.json -o ./instances
+    python -m modpack_downloader resume
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from requests import Session
+
+from .rpc.event_listener import Aria2EventListener
+from .utils.aria2_process import Aria2Error, Aria2Process
+from .utils.constants import DOWNLOAD_WINDOW, OVERWOLF_UA
+from .utils.download_manager import DownloadManager, DownloadOptions
+from .utils.download_session import DownloadSession
+from .utils.input_options import InputOptions, ModpackType
+from .utils.hash_index import HashIndex, open_hash_index
+from .utils.instance_record import InstanceRecord, UpdatePlan, plan_update
+from .utils.metadata_cache import MetadataCache
+from .utils.mod_cache import ModCache
+from .utils.modpack_exporter import LauncherInstaller, MultiMCPackExporter
+from .utils.modpack_manifest import ModpackManifest
+from .utils.modpack_resolver import ModpackResolver
+from .utils.native_downloader import NATIVE_AVAILABLE, NativeDownloadManager, NativeDownloader
+from .utils.override_extractor import OverrideExtractor
+
+__all__ = ["main"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+EXIT_OK = 0
+EXIT_RESOLVE_FAILED = 1
+EXIT_ARIA2_FAILED = 3
+EXIT_DOWNLOAD_FAILED = 4
+EXIT_EXPORT_FAILED = 5
+EXIT_INSTALL_FAILED = 6
+EXIT_INTERRUPTED = 130
+
+DEFAULT_ARIA2_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aria2.conf")
+
+
+class Reporter:
+    """Writes progress to stdout, either human readable or as JSON lines"""
+
+    def __init__(self, json_lines: bool = False):
+        self.json_lines = json_lines
+        self._lock = threading.Lock()
+
+    def _write(self, event: str, text: str, pack: Optional[str] = None, **fields):
+        with self._lock:
+            if self.json_lines:
+                if pack is not None:
+                    fields = {"pack": pack, **fields}
+                print(json.dumps({"event": event, **fields}), flush=True)
+            else:
+                print(f"[{pack}] {text}" if pack is not None else text, flush=True)
+
+    def status(self, message: str, pack: Optional[str] = None):
+        self._write("status", message, pack, message=message)
+
+    def progress(self, completed: int, total: int, pack: Optional[str] = None):
+        self._write("progress", f"{completed}/{total}", pack, completed=completed, total=total)
+
+    def job_progress(self, status: str, completed: int, total: int, pack: Optional[str] = None):
+        self._write("job_progress", f"{status}: {completed}/{total}", pack, status=status, completed=completed,
+                    total=total)
+
+    def error(self, message: str, pack: Optional[str] = None):
+        if self.json_lines:
+            self._write("error", message, pack, message=message)
+        else:
+            with self._lock:
+                print(f"error: [{pack}] {message}" if pack is not None else f"error: {message}",
+                      file=sys.stderr, flush=True)
+
+    def complete(self, modpack: ModpackManifest, pack: Optional[str] = None):
+        info = modpack.dict(exclude={"modlist", "overrides"}, exclude_defaults=True)
+        text = "\n".join(f"{key}: {value}" for key, value in info.items())
+        self._write("complete", text, pack, **info)
+
+
+@dataclass
+class PackJob:
+    """One modpack of a batch, label is None when downloading a single modpack"""
+    label: Optional[str]
+    # None when resuming a session
+    options: Optional[InputOptions]
+    modpack: Optional[ModpackManifest] = None
+    plan: Optional[UpdatePlan] = None
+    session: Optional[DownloadSession] = None
+    hash_index: Optional[HashIndex] = None
+    downloads: list[DownloadOptions] = field(default_factory=list)
+    ok: bool = False
+
+
+def load_api_key() -> bool:
+    if os.environ.get("CF_API_KEY") is not None:
+        return True
+    try:
+        from api_key import CF_API_KEY
+    except ImportError:
+        return False
+    os.environ["CF_API_KEY"] = CF_API_KEY
+    return True
+
+
+def resolve(job: PackJob, reporter: Reporter, metadata_cache: Optional[MetadataCache]) -> bool:
+    """Resolve a modpack and work out which files have to be downloaded"""
+    if job.session is not None:
+        reporter.status("Checking files downloaded before", job.label)
+        job.hash_index = open_hash_index(job.modpack.minecraft_dir)
+        # files downloaded before are skipped by the download manager, which checks them against the hash index
+        job.downloads = job.session.downloads
+        return True
+
+    result = {}
+    resolver = ModpackResolver(job.options, Session(), metadata_cache)
+    resolver.complete.connect(lambda manifest: result.setdefault("manifest", manifest))
+    resolver.failed.connect(functools.partial(reporter.error, pack=job.label))
+    resolver.status.connect(functools.partial(reporter.status, pack=job.label))
+    try:
+        resolver.run()
+        if "manifest" not in result:
+            return False
+        job.modpack = result["manifest"]
+        job.hash_index = open_hash_index(job.modpack.minecraft_dir)
+        job.plan = plan_update(job.modpack, job.hash_index)
+        job.plan.apply(job.modpack.minecraft_dir)
+        job.downloads = job.plan.downloads
+        try:
+            job.session = DownloadSession.start(job.modpack, job.plan)
+        except OSError as e:
+            logger.warning("Failed to write download session, the download won't be resumable", exc_info=e)
+        return True
+    except Exception as e:
+        logger.error("Unknown error resolving modpack", exc_info=e)
+        reporter.error("Failed to resolve modpack", job.label)
+        return False
+
+
+def export(job: PackJob, reporter: Reporter) -> bool:
+    """Export a downloaded modpack as a MultiMC zip next to its minecraft dir"""
+    exporter = MultiMCPackExporter(job.modpack)
+    exporter.status.connect(functools.partial(reporter.status, pack=job.label))
+    exporter.progress_changed.connect(functools.partial(reporter.progress, pack=job.label))
+    exporter.failed.connect(functools.partial(reporter.error, pack=job.label))
+    result = {}
+    exporter.complete.connect(lambda path: result.setdefault("path", path))
+    exporter.run()
+    if "path" in result:
+        reporter.status(f"Exported MultiMC pack to {result['path']}", job.label)
+    return "path" in result
+
+
+def install(job: PackJob, reporter: Reporter) -> bool:
+    """Install a downloaded modpack as an instance of the launcher in options.launcher_dir"""
+    installer = LauncherInstaller(job.modpack, job.options.launcher_dir)
+    installer.status.connect(functools.partial(reporter.status, pack=job.label))
+    installer.failed.connect(functools.partial(reporter.error, pack=job.label))
+    result = {}
+    installer.complete.connect(lambda path: result.setdefault("path", path))
+    installer.run()
+    if "path" in result:
+        reporter.status(f"Installed into {result['path']}", job.label)
+    return "path" in result
+
+
+def run_jobs(jobs: list[PackJob], args: argparse.Namespace, reporter: Reporter) -> int:
+    """Resolve modpacks in parallel and download all of them through one aria2 instance (or the native engine)"""
+    if args.engine == "native":
+        if not NATIVE_AVAILABLE:
+            reporter.error("The native download engine requires httpx, install it with pip install httpx[http2]")
+            return EXIT_ARIA2_FAILED
+        downloader = client = NativeDownloader(user_agent=OVERWOLF_UA)
+    else:
+        try:
+            downloader = Aria2Process(args.aria2_conf, daemon=args.daemon)
+            downloader.start(attach=args.daemon)
+            client = downloader.client()
+        except (OSError, Aria2Error) as e:
+            reporter.error(str(e))
+            return EXIT_ARIA2_FAILED
+
+    mod_cache = None
+    metadata_cache = None
+    if not args.no_cache:
+        try:
+            mod_cache = ModCache()
+        except Exception as e:
+            logger.warning("Failed to open mod cache, downloading without it", exc_info=e)
+        try:
+            metadata_cache = MetadataCache()
+        except Exception as e:
+            logger.warning("Failed to open metadata cache, resolving without it", exc_info=e)
+
+    if args.engine == "native":
+        event_listener = downloader
+        manager = NativeDownloadManager(downloader, mod_cache, window=args.window)
+    else:
+        event_listener = Aria2EventListener(client)
+        manager = DownloadManager(client, event_listener, mod_cache, shared=downloader.shared, window=args.window)
+    pending = set(range(len(jobs)))
+
+    def job_done(index: int):
+        pending.discard(index)
+        if not pending:
+            manager.shutdown()
+
+    def pack_complete(pack_id: str):
+        job = jobs[int(pack_id)]
+        try:
+            InstanceRecord.from_manifest(job.modpack, job.plan).save(job.modpack.minecraft_dir)
+        except OSError as e:
+            logger.error("Failed to save install record", exc_info=e)
+        if job.session is not None:
+            job.session.remove()
+        job.ok = True
+        reporter.complete(job.modpack, job.label)
+        job_done(int(pack_id))
+
+    def pack_failed(pack_id: str, failed: int):
+        reporter.error(f"{failed} files failed to install", jobs[int(pack_id)].label)
+        job_done(int(pack_id))
+
+    def resolved(index: int, future: Future):
+        job = jobs[index]
+        if future.result():
+            extractors = [OverrideExtractor(job.modpack, job.hash_index)] if job.modpack.archive else []
+            manager.add_modpack(str(index), job.downloads, job.label or job.modpack.name, extractors, job.hash_index)
+        else:
+            job_done(index)
+
+    manager.pack_progress.connect(
+        lambda pack_id, completed, total: reporter.progress(completed, total, jobs[int(pack_id)].label))
+    manager.job_progress.connect(
+        lambda pack_id, status, completed, total: reporter.job_progress(status, completed, total,
+                                                                        jobs[int(pack_id)].label))
+    manager.pack_complete.connect(pack_complete)
+    manager.pack_failed.connect(pack_failed)
+    event_listener.start()
+
+    with ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix="ModpackResolverThread") as pool:
+        for i, job in enumerate(jobs):
+            future = pool.submit(resolve, job, reporter, metadata_cache)
+            future.add_done_callback(functools.partial(lambda index, f: manager.post(resolved, index, f), i))
+
+        try:
+            manager.run()
+        except KeyboardInterrupt:
+            reporter.error("Interrupted")
+            pool.shutdown(wait=False, cancel_futures=True)
+            manager.shutdown()
+            return EXIT_INTERRUPTED
+        finally:
+            downloader.wait()
+
+    # exported once every download finished, so that packing doesn't compete with the downloads for disk
+    exports = [job for job in jobs if job.ok and job.options is not None and job.options.multimc]
+    if not all([export(job, reporter) for job in exports]):
+        return EXIT_EXPORT_FAILED
+    installs = [job for job in jobs if job.ok and job.options is not None and job.options.launcher_dir]
+    if not all([install(job, reporter) for job in installs]):
+        return EXIT_INSTALL_FAILED
+    if all(job.ok for job in jobs):
+        return EXIT_OK
+    if all(job.modpack is None for job in jobs):
+        return EXIT_RESOLVE_FAILED
+    return EXIT_DOWNLOAD_FAILED
+
+
+def load_batch(path: str, args: argparse.Namespace) -> list[PackJob]:
+    """
+    Read a batch file, a JSON list of modpacks like
+    [{"source": "cf", "file": "pack.zip"}, {"source": "ftb", "pack_id": 35, "version_id": 6287, "save_dir": "..."},
+     {"source": "cf-online", "project": "all-the-mods-9", "file_id": 5125809},
+     {"source": "modrinth", "file": "pack.mrpack"}, {"source": "modrinth", "project": "fabulously-optimized"}]
+    Relative paths are relative to the batch file
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        entries = json.load(f)
+
+    jobs = []
+    for i, entry in enumerate(entries):
+        save_dir = os.path.join(base_dir, entry["save_dir"]) if "save_dir" in entry else os.path.abspath(args.save_dir)
+        update = entry.get("update", args.update)
+        multimc = entry.get("multimc", args.multimc)
+        launcher_dir = os.path.join(base_dir, entry["install_to"]) if "install_to" in entry else args.install_to
+        match entry["source"]:
+            case "cf":
+                file = os.path.join(base_dir, entry["file"])
+                options = InputOptions(modpack_type=ModpackType.CF_LOCAL, save_dir=save_dir,
+                                       local_modpack_file=file, update_instance=update, multimc=multimc)
+                label = entry.get("name", os.path.basename(file))
+            case "cf-online":
+                options = InputOptions(modpack_type=ModpackType.CF_ONLINE, save_dir=save_dir,
+                                       project=str(entry["project"]), version_id=int(entry.get("file_id", 0)),
+                                       update_instance=update, multimc=multimc)
+                label = entry.get("name", f"cf-{entry['project']}-{entry.get('file_id', 'latest')}")
+            case "modrinth":
+                file = os.path.join(base_dir, entry["file"]) if "file" in entry else ""
+                options = InputOptions(modpack_type=ModpackType.MODRINTH, save_dir=save_dir, local_modpack_file=file,
+                                       project=entry.get("project", ""), version=entry.get("version", ""),
+                                       update_instance=update, multimc=multimc)
+                label = entry.get("name", os.path.basename(file) if file else f"mr-{entry['project']}")
+            case "ftb":
+                options = InputOptions(modpack_type=ModpackType.FTB, save_dir=save_dir,
+                                       modpack_id=int(entry["pack_id"]), version_id=int(entry["version_id"]),
+                                       update_instance=update, multimc=multimc)
+                label = entry.get("name", f"ftb-{entry['pack_id']}-{entry['version_id']}")
+            case source:
+                raise ValueError(f"unknown modpack source: {source}")
+        options.launcher_dir = launcher_dir
+        jobs.append(PackJob(label=f"{i}:{label}", options=options))
+    return jobs
+
+
+def load_sessions() -> list[PackJob]:
+    """Jobs resuming every unfinished download"""
+    jobs = []
+    for i, session in enumerate(DownloadSession.load_all()):
+        jobs.append(PackJob(label=f"{i}:{session.manifest.name}", options=None, modpack=session.manifest,
+                            plan=session.plan, session=session))
+    return jobs
+
+
+def check_job(job: PackJob) -> Optional[str]:
+    options = job.options
+    if options is None:
+        return None
+    if not os.path.isdir(options.save_dir):
+        return "Invalid directory to save modpack"
+    if options.modpack_type == ModpackType.CF_LOCAL and not os.path.isfile(options.local_modpack_file):
+        return "Invalid modpack file path"
+    if options.modpack_type == ModpackType.MODRINTH and options.local_modpack_file \
+            and not os.path.isfile(options.local_modpack_file):
+        return "Invalid modpack file path"
+    if options.launcher_dir and not os.path.isdir(options.launcher_dir):
+        return "Invalid launcher instances directory"
+    if options.modpack_type in (ModpackType.CF_LOCAL, ModpackType.CF_ONLINE) and not load_api_key():
+        return "Cannot find curseforge api key"
+    return None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--save-dir", default=os.getcwd(), help="directory to save the modpack in")
+    common.add_argument("--update", action="store_true",
+                        help="treat the save dir as the minecraft dir of an installed instance and update it")
+    common.add_argument("--multimc", action="store_true",
+                        help="also export the modpack as a zip that MultiMC and Prism Launcher can import")
+    common.add_argument("--install-to", default="", metavar="INSTANCES_DIR",
+                        help="also install the modpack as an instance of MultiMC or Prism Launcher, given the "
+                             "instances folder of the launcher")
+    common.add_argument("--json", action="store_true", help="report progress as JSON lines")
+    common.add_argument("--aria2-conf", default=DEFAULT_ARIA2_CONF, help="aria2 config file")
+    common.add_argument("--daemon", action="store_true",
+                        help="reuse the aria2 listening on the rpc port of the config file, or start one that keeps "
+                             "running after exit so that later runs can reuse it")
+    common.add_argument("--engine", choices=["aria2", "native"],
+                        default=os.environ.get("MODPACK_DOWNLOADER_ENGINE", "aria2"),
+                        help="download with an aria2 subprocess or the built-in engine (requires httpx)")
+    common.add_argument("--window", type=int, default=DOWNLOAD_WINDOW,
+                        help="number of files handed to the download engine at the same time")
+    common.add_argument("--no-cache", action="store_true", help="don't use the shared mod and metadata caches")
+    common.add_argument("-v", "--verbose", action="store_true", help="print debug logs to stderr")
+
+    parser = argparse.ArgumentParser(prog="modpack_downloader", description="Minecraft Modpack Downloader")
+    sources = parser.add_subparsers(dest="source", required=True)
+
+    cf = sources.add_parser("cf", parents=[common], help="download a local curseforge modpack zip")
+    cf.add_argument("file", help="path to the modpack zip")
+
+    cf_online = sources.add_parser("cf-online", parents=[common], help="download a curseforge modpack by project")
+    cf_online.add_argument("project", help="project id or slug")
+    cf_online.add_argument("file_id", type=int, nargs="?", default=0, help="file id, the latest file by default")
+
+    ftb = sources.add_parser("ftb", parents=[common], help="download a FTB modpack")
+    ftb.add_argument("pack_id", type=int)
+    ftb.add_argument("version_id", type=int)
+
+    mr = sources.add_parser("mr", parents=[common], help="download a modrinth modpack")
+    mr.add_argument("pack", help="path to a .mrpack file, or a project id or slug")
+    mr.add_argument("version", nargs="?", default="", help="version id of the project, the latest one by default")
+
+    batch = sources.add_parser("batch", parents=[common], help="download several modpacks at once")
+    batch.add_argument("file", help="JSON file listing the modpacks, see load_batch()")
+    batch.add_argument("-j", "--jobs", type=int, default=4, help="number of modpacks resolved in parallel")
+
+    resume = sources.add_parser("resume", parents=[common], help="resume downloads that did not finish")
+    resume.add_argument("-j", "--jobs", type=int, default=4, help="number of modpacks checked in parallel")
+    return parser
+
+
+def input_options(args: argparse.Namespace) -> InputOptions:
+    match args.source:
+        case "cf":
+            return InputOptions(modpack_type=ModpackType.CF_LOCAL, save_dir=args.save_dir,
+                                local_modpack_file=args.file, update_instance=args.update, multimc=args.multimc)
+        case "cf-online":
+            return InputOptions(modpack_type=ModpackType.CF_ONLINE, save_dir=args.save_dir, project=args.project,
+                                version_id=args.file_id, update_instance=args.update, multimc=args.multimc)
+        case "mr":
+            if os.path.isfile(args.pack):
+                return InputOptions(modpack_type=ModpackType.MODRINTH, save_dir=args.save_dir,
+                                    local_modpack_file=args.pack, update_instance=args.update, multimc=args.multimc)
+            return InputOptions(modpack_type=ModpackType.MODRINTH, save_dir=args.save_dir, project=args.pack,
+                                version=args.version, update_instance=args.update, multimc=args.multimc)
+        case "ftb":
+            return InputOptions(modpack_type=ModpackType.FTB, save_dir=args.save_dir, modpack_id=args.pack_id,
+                                version_id=args.version_id, update_instance=args.update, multimc=args.multimc)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="[%(asctime)s] [%(name)-s] [%(threadName)s] [%(levelname)-s] %(message)s")
+    reporter = Reporter(args.json)
+
+    if args.source == "batch":
+        try:
+            jobs = load_batch(args.file, args)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            reporter.error(f"Invalid batch file: {e}")
+            return EXIT_RESOLVE_FAILED
+    elif args.source == "resume":
+        jobs = load_sessions()
+        if not jobs:
+            reporter.status("Nothing to resume")
+            return EXIT_OK
+    else:
+        args.jobs = 1
+        options = input_options(args)
+        options.launcher_dir = args.install_to
+        jobs = [PackJob(label=None, options=options)]
+
+    for job in jobs:
+        if error := check_job(job):
+            reporter.error(error, job.label)
+            return EXIT_RESOLVE_FAILED
+    return run_jobs(jobs, args, reporter)
@@ -1,14 +1,14 @@
 from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSlot
 from PyQt6.QtWidgets import QTableView
 
-from modpack_downloader.utils.download_manager import DownloadManager
+from .qt_bridge import QtDownloadManager
 from .utils.sizes import format_size
 
 
 class A2TaskModel(QAbstractTableModel):
     headers = ("File Name", "Size", "Download Speed", "Progress", "Status", "Error Message")
 
-    def __init__(self, task_manager: DownloadManager, table: QTableView, *args):
+    def __init__(self, task_manager: QtDownloadManager, table: QTableView, *args):
         super().__init__(*args)
         self.table = table
         self.task_manager = task_manager
@@ -31,20 +31,23 @@ class A2TaskModel(QAbstractTableModel):
             return None
 
         if role == Qt.ItemDataRole.DisplayRole:
-            task = self.task_manager.task_list[index.row()]
+            tasks = self.task_manager.task_list
+            row = index.row()
+            if row >= len(tasks):
+                return None
             match self.headers[index.column()]:
                 case "File Name":
-                    return task.name
+                    return tasks.name(row)
                 case "Size":
-                    return f"{format_size(task.completedLength)}/{format_size(task.totalLength)}"
+                    return f"{format_size(tasks.completed_length(row))}/{format_size(tasks.total_length(row))}"
                 case "Download Speed":
-                    return f"{format_size(task.downloadSpeed)}/s"
+                    return f"{format_size(tasks.download_speed(row))}/s"
                 case "Progress":
-                    return task.progress
+                    return tasks.progress(row)
                 case "Status":
-                    return task.status
+                    return tasks.status(row)
                 case "Error Message":
-                    return task.errorMessage
+                    return tasks.error_message(row)
         elif role == Qt.ItemDataRole.TextAlignmentRole:
             header_label = self.headers[index.column()]
             if header_label == "File Name" or header_label == "Error Message":
@@ -53,14 +56,31 @@ class A2TaskModel(QAbstractTableModel):
 
         return None
 
-    @pyqtSlot()
-    def update_data(self):
+    @pyqtSlot(list)
+    def update_data(self, changed: list[int]):
         new_task_num = len(self.task_manager.task_list)
-        if self.task_num != new_task_num:
+        if new_task_num < self.task_num:
+            # the task list was cleared for a new download
+            self.beginResetModel()
             self.task_num = new_task_num
-            self.layoutChanged.emit()
+            self.endResetModel()
+            return
+        if new_task_num > self.task_num:
+            self.beginInsertRows(QModelIndex(), self.task_num, new_task_num - 1)
+            self.task_num = new_task_num
+            self.endInsertRows()
 
-        # only update visible rows
-        top_row = self.table.indexAt(self.table.rect().topLeft())
-        bottom_row = self.table.indexAt(self.table.rect().bottomRight())
-        self.dataChanged.emit(top_row, bottom_row)
+        # one dataChanged per run of consecutive changed rows
+        last_column = self.columnCount() - 1
+        start = prev = None
+        for row in changed:
+            if row >= self.task_num:
+                break
+            if start is None:
+                start = row
+            elif row != prev + 1:
+                self.dataChanged.emit(self.index(start, 0), self.index(prev, last_column))
+                start = row
+            prev = row
+        if start is not None:
+            self.dataChanged.emit(self.index(start, 0), self.index(prev, last_column))
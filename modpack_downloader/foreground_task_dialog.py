@@ -4,6 +4,7 @@ import os.path
 from PyQt6.QtCore import *
 from PyQt6.QtWidgets import *
 
+from .qt_bridge import QtForegroundTask
 from .ui.ui_foreground_task import Ui_ForegroundTaskDialog
 from .utils.foreground_task import ForegroundTask
 
@@ -20,7 +21,7 @@ class ForegroundTaskDialog(QDialog, Ui_ForegroundTaskDialog):
         self.rejected.connect(self.cancel)
         self.return_data = None
 
-        self.util = util
+        self.util = QtForegroundTask(util)
         self.util_thread = QThread()
         self.util.moveToThread(self.util_thread)
         self.util.complete.connect(self.complete)
@@ -1,27 +1,32 @@
-import functools
 import logging
 import os
-import shutil
 import sys
-import time
-from configparser import ConfigParser
+from typing import Optional
 
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from PyQt6.QtWidgets import *
-from packaging.version import Version
 from requests import Session
 
 from .new_download_dialog import *
 from .download_table_view import A2TaskModel
 from .foreground_task_dialog import ForegroundTaskDialog
-from .rpc.client import Aria2Client
+from .qt_bridge import QtDownloadManager
 from .rpc.event_listener import Aria2EventListener
 from .ui.ui_main_window import Ui_MainWindow
-from .utils.download_manager import DownloadManager
-from .utils.modpack_exporter import MultiMCPackExporter
+from .utils.aria2_process import Aria2Error, Aria2Process
+from .utils.download_manager import DownloadManager, DownloadOptions
+from .utils.constants import OVERWOLF_UA
+from .utils.download_session import DownloadSession
+from .utils.hash_index import HashIndex, open_hash_index
+from .utils.instance_record import InstanceRecord, UpdatePlan, UpdatePlanner
+from .utils.metadata_cache import MetadataCache
+from .utils.mod_cache import ModCache
+from .utils.modpack_exporter import LauncherInstaller, MultiMCPackExporter
 from .utils.modpack_manifest import ModpackManifest
 from .utils.modpack_resolver import ModpackResolver
+from .utils.native_downloader import NATIVE_AVAILABLE, NativeDownloader, NativeDownloadManager
+from .utils.override_extractor import OverrideExtractor
 
 logger = logging.getLogger(os.path.basename(__file__))
 
@@ -43,80 +48,59 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     def __init__(self):
         super().__init__()
         self.setupUi(self)
+        self.job_pbar = QProgressBar(self.statusbar)
+        self.job_pbar.setMaximumWidth(200)
+        self.job_pbar.hide()
+        self.statusbar.addPermanentWidget(self.job_pbar)
         self.task_gids = []
+        self.packs: dict[str, tuple[ModpackManifest, UpdatePlan]] = {}
+        self.sessions: dict[str, DownloadSession] = {}
+        # packs exported as MultiMC zip once downloaded
+        self.exports: set[str] = set()
+        # pack -> launcher instances dir it is installed into once downloaded
+        self.installs: dict[str, str] = {}
 
         self.actionExit.triggered.connect(self.close)
         self.actionDownload.triggered.connect(self.download_modpack)
 
         self.session = Session()
 
-        logger.info("Reading aria2 config file")
-
-        conf_file = os.path.join(os.path.dirname(sys.argv[0]), "aria2.conf")
-        parser = ConfigParser()
-        with open(conf_file) as f:
-            parser.read_string("[DEFAULT]\n"+f.read())
-
-        port = int(parser["DEFAULT"].get("rpc-listen-port", "6800"))
-        logger.info(f"Aria2 port: {port}")
-
-        self.aria2_args = ["--conf-path", conf_file, "--stop-with-process", str(os.getpid()),
-                           "--log=aria2.log", "--log-level=debug"]
-
-        logger.info("Locating aria2 executable")
-
-        if os.name == "nt":
-            a2_exe = shutil.which("aria2c.exe")
-        elif os.name == "posix":
-            a2_exe = shutil.which("aria2c")
+        self.downloader: Optional[NativeDownloader] = None
+        self.aria2: Optional[Aria2Process] = None
+        if os.environ.get("MODPACK_DOWNLOADER_ENGINE") == "native" and NATIVE_AVAILABLE:
+            self.downloader = NativeDownloader(user_agent=OVERWOLF_UA)
         else:
-            QMessageBox.critical(self, self.windowTitle(), "Unsupported platform")
-            sys.exit(1)
-        if a2_exe is None:
-            QMessageBox.critical(self, self.windowTitle(), "Aria2 executable not found, please install aria2")
-            sys.exit(1)
-
-        logger.info(f"Aria2 executable found: {a2_exe}")
-
-        self.aria2 = QProcess()
-        self.aria2.setProgram(a2_exe)
-        self.aria2.setArguments(self.aria2_args)
-        self.aria2.start()
-
-        if not self.aria2.waitForStarted():
-            QMessageBox.critical(self, self.windowTitle(), "Failed to start aria2")
-            sys.exit(1)
-
-        time.sleep(1)
-        self.client = Aria2Client(port=port, session=self.session)
-        min_version = Version("1.37.0")
-        try:
-            version = Version(self.client.get_version()["version"])
-            logger.info(f"Aria2 version: {version}")
-            if version < min_version:
-                logger.critical(f"Aria2 below 1.37.0 (currently installed {version}) wont work")
-                QMessageBox.critical(self, self.windowTitle(),
-                                     f"Aria2 below 1.37.0 (currently installed {version}) wont work.\n"
-                                     "Please upgrade aria2.")
-                sys.exit(1)
+            self.start_aria2()
 
+        try:
+            self.mod_cache = ModCache()
         except Exception as e:
-            logger.critical("Failed to get aria2 version,exiting...", exc_info=e)
-            sys.exit(1)
+            logger.error("Failed to open mod cache, downloading without it", exc_info=e)
+            self.mod_cache = None
 
-        self.event_listener = Aria2EventListener(self.client)
+        try:
+            self.metadata_cache = MetadataCache()
+        except Exception as e:
+            logger.error("Failed to open metadata cache, resolving without it", exc_info=e)
+            self.metadata_cache = None
 
-        self.task_manager_thread = QThread()
-        self.task_manager = DownloadManager(self.client, self.event_listener)
-        self.task_manager.moveToThread(self.task_manager_thread)
-        self.task_manager_thread.started.connect(self.task_manager.run)
-        self.task_manager.destroyed.connect(self.task_manager_thread.quit)
+        if self.downloader is not None:
+            manager = NativeDownloadManager(self.downloader, self.mod_cache)
+        else:
+            manager = DownloadManager(self.client, self.event_listener, self.mod_cache, shared=self.aria2.shared)
+        self.task_manager = QtDownloadManager(manager)
         self.task_manager.progress_changed.connect(self.update_pbar)
+        self.task_manager.job_progress.connect(self.update_job_pbar)
+        self.task_manager.pack_complete.connect(self.download_complete)
+        self.task_manager.pack_failed.connect(self.download_failed)
 
         self.button_restart_failed.clicked.connect(self.task_manager.retry_all)
 
-        self.task_manager_thread.start()
-        self.event_listener.start()
+        self.task_manager.start_thread()
+        if self.downloader is not None:
+            self.downloader.start()
+        else:
+            self.event_listener.start()
 
         self.model = A2TaskModel(self.task_manager, self.tableView)
         self.delegate = ProgressDelegate()
@@ -126,11 +110,47 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.start_time = 0
         self.end_time = 0
 
+        QTimer.singleShot(0, self.resume_sessions)
+
+    def start_aria2(self):
+        """Start aria2, falls back to the native engine if aria2 cannot be started and httpx is installed"""
+        logger.info("Reading aria2 config file")
+
+        conf_file = os.path.join(os.path.dirname(sys.argv[0]), "aria2.conf")
+        try:
+            self.aria2 = Aria2Process(conf_file, extra_args=["--log=aria2.log", "--log-level=debug"])
+            logger.info(f"Aria2 executable found: {self.aria2.executable}")
+            logger.info(f"Aria2 port: {self.aria2.port}")
+            # an aria2 left over from another instance of the downloader is reused
+            self.aria2.start(attach=True)
+            self.client = self.aria2.client(self.session)
+        except (OSError, Aria2Error) as e:
+            if not NATIVE_AVAILABLE:
+                logger.critical("Failed to start aria2, exiting...", exc_info=e)
+                QMessageBox.critical(self, self.windowTitle(), str(e))
+                sys.exit(1)
+            logger.error("Failed to start aria2, using the native download engine", exc_info=e)
+            self.aria2 = None
+            self.downloader = NativeDownloader(user_agent=OVERWOLF_UA)
+            return
+        self.event_listener = Aria2EventListener(self.client)
+
     @pyqtSlot(int, int)
     def update_pbar(self, completed, total):
         self.progressBar.setRange(0, total)
         self.progressBar.setValue(completed)
 
+    def update_job_pbar(self, pack_id: str, status: str, completed: int, total: int):
+        """Progress of background jobs like override extraction, shown in the status bar next to the downloads"""
+        if completed >= total:
+            self.job_pbar.hide()
+            self.statusbar.clearMessage()
+            return
+        self.statusbar.showMessage(status)
+        self.job_pbar.setRange(0, total)
+        self.job_pbar.setValue(completed)
+        self.job_pbar.show()
+
     def closeEvent(self, event: QCloseEvent):
         if self.task_manager.downloading:
             ans = QMessageBox.warning(self, self.windowTitle(), "Task in progress. Exit?",
@@ -140,46 +160,109 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 return
 
         msg = QMessageBox()
-        msg.setText("Stopping aria2...")
+        stopping_aria2 = self.aria2 is not None and not self.aria2.shared
+        msg.setText("Stopping aria2..." if stopping_aria2 else "Stopping downloads...")
         msg.setWindowTitle(self.windowTitle())
         msg.setStandardButtons(QMessageBox.StandardButton.NoButton)
         msg.setWindowFlags(Qt.WindowType.CustomizeWindowHint | Qt.WindowType.WindowTitleHint)
         msg.show()
         QApplication.processEvents()
 
-        self.task_manager.stop.emit()
-        self.aria2.waitForFinished()
+        self.task_manager.stop()
+        (self.aria2 or self.downloader).wait()
         event.accept()
 
     @pyqtSlot()
     def download_modpack(self):
-        if self.task_manager.downloading:
-            QMessageBox.warning(self, self.windowTitle(), "Already downloading")
-
         newdialog = NewDownloadDialog()
         newdialog.show()
         newdialog.exec()
         if not newdialog.result():
             return
         dlinfo = newdialog.return_data
-        resolver = ModpackResolver(dlinfo, Session())
+        resolver = ModpackResolver(dlinfo, Session(), self.metadata_cache)
         res_dialog = ForegroundTaskDialog(resolver, self)
         res_dialog.exec()
         if not res_dialog.result():
             return
 
         modpack_info: ModpackManifest = res_dialog.return_data
-        task_list = modpack_info.modlist
-        self.task_manager.start.emit(task_list)
-        self.task_manager.download_complete.connect(functools.partial(self.download_complete, modpack_info))
+        if modpack_info.minecraft_dir in self.packs:
+            QMessageBox.warning(self, self.windowTitle(), f"Already downloading into {modpack_info.minecraft_dir}")
+            return
+
+        # reads the archive and hashes user files, and deletes the files the modpack no longer has
+        planner_dialog = ForegroundTaskDialog(UpdatePlanner(modpack_info), self)
+        planner_dialog.exec()
+        if not planner_dialog.result():
+            return
+        plan, hash_index = planner_dialog.return_data
+        try:
+            session = DownloadSession.start(modpack_info, plan)
+        except OSError as e:
+            logger.warning("Failed to write download session, the download won't be resumable", exc_info=e)
+            session = None
+        if dlinfo.multimc:
+            self.exports.add(modpack_info.minecraft_dir)
+        if dlinfo.launcher_dir:
+            self.installs[modpack_info.minecraft_dir] = dlinfo.launcher_dir
+        self.start_download(modpack_info, plan, plan.downloads, session, hash_index)
+
+    def start_download(self, modpack_info: ModpackManifest, plan: UpdatePlan, downloads: list[DownloadOptions],
+                       session: Optional[DownloadSession], hash_index: Optional[HashIndex]):
+        self.packs[modpack_info.minecraft_dir] = (modpack_info, plan)
+        if session is not None:
+            self.sessions[modpack_info.minecraft_dir] = session
+        jobs = [OverrideExtractor(modpack_info, hash_index)] if modpack_info.archive else []
+        self.task_manager.start(modpack_info.minecraft_dir, downloads, modpack_info.name, jobs, hash_index)
+
+    @pyqtSlot()
+    def resume_sessions(self):
+        sessions = [s for s in DownloadSession.load_all() if s.manifest.minecraft_dir not in self.packs]
+        if not sessions:
+            return
+        names = "\n".join(f"{s.manifest.name} {s.manifest.version} ({s.manifest.minecraft_dir})" for s in sessions)
+        ans = QMessageBox.question(self, self.windowTitle(), f"Resume unfinished downloads?\n{names}")
+        for session in sessions:
+            if ans == QMessageBox.StandardButton.Yes:
+                # the download manager checks which files are already there on its worker thread, hashing them here
+                # would freeze the window
+                self.start_download(session.manifest, session.plan, session.downloads, session,
+                                    open_hash_index(session.manifest.minecraft_dir))
+            else:
+                session.remove()
 
     def export_multimc_pack(self, modpack_info: ModpackManifest):
         dialog = ForegroundTaskDialog(MultiMCPackExporter(modpack_info), parent=self)
         dialog.exec()
+        if dialog.result():
+            QMessageBox.information(self, self.windowTitle(), f"Exported MultiMC pack to {dialog.return_data}")
+
+    def install_into_launcher(self, modpack_info: ModpackManifest, instances_dir: str):
+        dialog = ForegroundTaskDialog(LauncherInstaller(modpack_info, instances_dir), parent=self)
+        dialog.exec()
+        if dialog.result():
+            QMessageBox.information(self, self.windowTitle(), f"Installed {modpack_info.name} as {dialog.return_data}")
+
+    @pyqtSlot(str, int)
+    def download_failed(self, pack_id: str, failed: int):
+        modpack, _ = self.packs[pack_id]
+        QMessageBox.warning(self, self.windowTitle(),
+                            f"{failed} files of {modpack.name} failed to install.\n"
+                            "Use \"Restart Failed Tasks\" to try again.")
+
+    @pyqtSlot(str)
+    def download_complete(self, pack_id: str):
+        modpack, plan = self.packs.pop(pack_id)
+        try:
+            InstanceRecord.from_manifest(modpack, plan).save(modpack.minecraft_dir)
+        except OSError as e:
+            logger.error("Failed to save install record", exc_info=e)
+        if pack_id in self.sessions:
+            self.sessions.pop(pack_id).remove()
 
-    def download_complete(self, modpack: ModpackManifest):
         msg = ""
-        for key, value in modpack.dict(exclude={"modlist"}, exclude_defaults=True).items():
+        for key, value in modpack.dict(exclude={"modlist", "overrides"}, exclude_defaults=True).items():
             msg += f"{key}: {value}\n"
 
         dialog = QDialog(self)
@@ -191,4 +274,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         layout.addWidget(text_edit)
         dialog.setLayout(layout)
         dialog.exec()
-        self.task_manager.download_complete.disconnect()
+
+        if pack_id in self.exports:
+            self.exports.remove(pack_id)
+            self.export_multimc_pack(modpack)
+        if pack_id in self.installs:
+            self.install_into_launcher(modpack, self.installs.pop(pack_id))
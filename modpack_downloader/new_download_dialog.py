@@ -1,29 +1,12 @@
 import os.path
 import pathlib
-from dataclasses import dataclass
-from enum import IntEnum
 from typing import Optional
 
 from PyQt6.QtCore import QDir
 from PyQt6.QtWidgets import QDialog, QMessageBox, QFileDialog
 
 from .ui.ui_download_options_dialog import Ui_DownloadOptionsDialog
-
-
-class ModpackType(IntEnum):
-    CF_LOCAL = 0
-    CF_ONLINE = 1
-    FTB = 2
-
-
-@dataclass
-class InputOptions:
-    modpack_type: ModpackType
-    save_dir: str
-    local_modpack_file: str = ""
-    modpack_id: int = 0
-    version_id: int = 0
-    multimc: bool = False
+from .utils.input_options import InputOptions, ModpackType
 
 
 class NewDownloadDialog(QDialog, Ui_DownloadOptionsDialog):
@@ -34,10 +17,13 @@ class NewDownloadDialog(QDialog, Ui_DownloadOptionsDialog):
         self.buttonGroup.setId(self.radioButton_cf_local, ModpackType.CF_LOCAL)
         self.buttonGroup.setId(self.radioButton_cf_online, ModpackType.CF_ONLINE)
         self.buttonGroup.setId(self.radioButton_ftb, ModpackType.FTB)
+        self.buttonGroup.setId(self.radioButton_modrinth, ModpackType.MODRINTH)
 
         self.buttonBox.accepted.connect(self.check_input)
         self.toolButton_browse_file.clicked.connect(self.browse_modpack)
+        self.toolButton_browse_mrpack.clicked.connect(self.browse_mrpack)
         self.toolButton_browse_save_dir.clicked.connect(self.browse_save_dir)
+        self.toolButton_browse_launcher_dir.clicked.connect(self.browse_launcher_dir)
 
         self.return_data: Optional[InputOptions] = None
 
@@ -46,17 +32,31 @@ class NewDownloadDialog(QDialog, Ui_DownloadOptionsDialog):
                                            filter="Curseforge Modpack (*.zip)")[0]
         self.lineEdit_modpack_file.setText(QDir.toNativeSeparators(path))
 
+    def browse_mrpack(self):
+        path = QFileDialog.getOpenFileName(self, self.windowTitle(), str(pathlib.Path.home()),
+                                           filter="Modrinth Modpack (*.mrpack)")[0]
+        self.lineEdit_mrpack_file.setText(QDir.toNativeSeparators(path))
+
     def browse_save_dir(self):
         save_dir = QFileDialog.getExistingDirectory(self, self.windowTitle(), str(pathlib.Path.home()))
         self.lineEdit_save_dir.setText(QDir.toNativeSeparators(save_dir))
 
+    def browse_launcher_dir(self):
+        launcher_dir = QFileDialog.getExistingDirectory(self, self.windowTitle(), str(pathlib.Path.home()))
+        self.lineEdit_launcher_dir.setText(QDir.toNativeSeparators(launcher_dir))
+
     def check_input(self):
         export_as_mmc = self.checkBox_multimc.isChecked()
+        update_instance = self.checkBox_update_instance.isChecked()
 
         save_dir = self.lineEdit_save_dir.text().strip()
         if not os.path.isdir(save_dir):
             QMessageBox.critical(self, self.windowTitle(), "Invalid directory to save modpack")
             return
+        launcher_dir = self.lineEdit_launcher_dir.text().strip()
+        if launcher_dir and not os.path.isdir(launcher_dir):
+            QMessageBox.critical(self, self.windowTitle(), "Invalid launcher instances directory")
+            return
 
         match self.buttonGroup.checkedId():
             case ModpackType.CF_LOCAL:
@@ -65,14 +65,36 @@ class NewDownloadDialog(QDialog, Ui_DownloadOptionsDialog):
                     QMessageBox.critical(self, self.windowTitle(), "Invalid modpack file path")
                     return
                 self.return_data = InputOptions(modpack_type=ModpackType.CF_LOCAL, save_dir=save_dir,
-                                                multimc=export_as_mmc, local_modpack_file=file_path)
+                                                multimc=export_as_mmc, local_modpack_file=file_path,
+                                                update_instance=update_instance)
 
             case ModpackType.CF_ONLINE:
-                QMessageBox.critical(self, self.windowTitle(), "Not implemented")
-                return
+                project = self.lineEdit_cf_project.text().strip()
+                if not project:
+                    QMessageBox.critical(self, self.windowTitle(), "Please enter a project id or slug")
+                    return
+                self.return_data = InputOptions(modpack_type=ModpackType.CF_ONLINE, project=project,
+                                                version_id=self.spinBox_cf_file_id.value(),
+                                                save_dir=save_dir, multimc=export_as_mmc,
+                                                update_instance=update_instance)
             case ModpackType.FTB:
                 self.return_data = InputOptions(modpack_type=ModpackType.FTB,
                                                 modpack_id=self.spinBox_pack_id.value(),
                                                 version_id=self.spinBox_version_id.value(),
-                                                save_dir=save_dir, multimc=export_as_mmc)
+                                                save_dir=save_dir, multimc=export_as_mmc,
+                                                update_instance=update_instance)
+            case ModpackType.MODRINTH:
+                file_path = self.lineEdit_mrpack_file.text().strip()
+                project = self.lineEdit_mr_project.text().strip()
+                if file_path and not os.path.isfile(file_path):
+                    QMessageBox.critical(self, self.windowTitle(), "Invalid modpack file path")
+                    return
+                if not file_path and not project:
+                    QMessageBox.critical(self, self.windowTitle(), "Please choose a .mrpack file or enter a project")
+                    return
+                self.return_data = InputOptions(modpack_type=ModpackType.MODRINTH, local_modpack_file=file_path,
+                                                project=project, version=self.lineEdit_mr_version.text().strip(),
+                                                save_dir=save_dir, multimc=export_as_mmc,
+                                                update_instance=update_instance)
+        self.return_data.launcher_dir = launcher_dir
         self.accept()
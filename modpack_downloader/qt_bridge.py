@@ -0,0 +1,75 @@
+import threading
+from typing import Iterable, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from .utils.download_manager import DownloadManager, DownloadOptions
+from .utils.foreground_task import ForegroundTask
+from .utils.hash_index import HashIndex
+from .utils.task_store import TaskStore
+
+__all__ = ["QtForegroundTask", "QtDownloadManager"]
+
+
+class QtForegroundTask(QObject):
+    """Runs a ForegroundTask in a QThread and re-emits its signals as Qt signals"""
+    complete = pyqtSignal(object)
+    progress_changed = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    status = pyqtSignal(str)
+
+    def __init__(self, task: ForegroundTask, parent=None):
+        super().__init__(parent)
+        self.task = task
+        self.task.complete.connect(self.complete.emit)
+        self.task.progress_changed.connect(self.progress_changed.emit)
+        self.task.failed.connect(self.failed.emit)
+        self.task.status.connect(self.status.emit)
+
+    @pyqtSlot()
+    def run(self):
+        self.task.run()
+
+
+class QtDownloadManager(QObject):
+    """Runs a DownloadManager on its own thread and re-emits its signals as Qt signals"""
+    task_updated = pyqtSignal(list)
+    download_complete = pyqtSignal()
+    progress_changed = pyqtSignal(int, int)
+    job_progress = pyqtSignal(str, str, int, int)
+    pack_complete = pyqtSignal(str)
+    pack_failed = pyqtSignal(str, int)
+
+    def __init__(self, manager: DownloadManager, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.manager.task_updated.connect(self.task_updated.emit)
+        self.manager.download_complete.connect(self.download_complete.emit)
+        self.manager.progress_changed.connect(self.progress_changed.emit)
+        self.manager.job_progress.connect(self.job_progress.emit)
+        self.manager.pack_complete.connect(self.pack_complete.emit)
+        self.manager.pack_failed.connect(self.pack_failed.emit)
+        self.thread = threading.Thread(target=self.manager.run, name="DownloadManagerThread", daemon=True)
+
+    @property
+    def downloading(self) -> bool:
+        return self.manager.downloading
+
+    @property
+    def task_list(self) -> TaskStore:
+        return self.manager.task_list
+
+    def start_thread(self):
+        self.thread.start()
+
+    def start(self, pack_id: str, modlist: list[DownloadOptions], name: str = "", jobs: Iterable[ForegroundTask] = (),
+              hash_index: Optional[HashIndex] = None):
+        self.manager.post(self.manager.add_modpack, pack_id, modlist, name, jobs, hash_index)
+
+    @pyqtSlot()
+    def retry_all(self):
+        self.manager.post(self.manager.retry_all)
+
+    def stop(self):
+        self.manager.post(self.manager.shutdown)
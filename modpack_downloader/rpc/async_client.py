@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import Callable, Container, Optional
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed
+
+from .client import Aria2Client, RPCException, make_payload, restart_uris
+
+__all__ = ["AsyncAria2Client"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+class AsyncAria2Client:
+    """
+    asyncio jsonrpc client for aria2 over a single websocket connection.
+    Every request gets its own id, so any number of calls can be in flight at the same time and responses are matched
+    to them as they arrive. Notifications received on the connection are passed to on_notification.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6800, token: Optional[str] = None,
+                 on_notification: Optional[Callable[[dict], None]] = None):
+        """
+        @param host: Aria2 rpc host
+        @param port: rpc port
+        @param token: rpc authentication token
+        @param on_notification: called with every notification (e.g. aria2.onDownloadComplete)
+        """
+        self.host = host
+        self.port = port
+        self.token = token
+        self.on_notification = on_notification
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ws: Optional[ClientConnection] = None
+        self._receiver: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_client(cls, client: Aria2Client, on_notification: Optional[Callable[[dict], None]] = None):
+        return cls(client.host, client.port, client.token, on_notification)
+
+    @property
+    def ws_server(self):
+        return f"ws://{self.host}:{self.port}/jsonrpc"
+
+    async def connect(self):
+        self._ws = await connect(self.ws_server, ping_interval=None, max_size=None)
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._receiver is not None:
+            await self._receiver
+
+    async def wait_closed(self):
+        """Wait until the connection is closed, e.g. by aria2 shutting down"""
+        await self._receiver
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _receive(self):
+        try:
+            async for message in self._ws:
+                msg = json.loads(message)
+                if "id" in msg:
+                    future = self._pending.pop(msg["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(msg)
+                elif "method" in msg and self.on_notification is not None:
+                    try:
+                        self.on_notification(msg)
+                    except Exception as e:
+                        logger.error("Unexpected error in notification handler", exc_info=e)
+        except ConnectionClosed:
+            pass
+        finally:
+            logger.info("Connection closed")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("aria2 connection closed"))
+            self._pending.clear()
+
+    async def call(self, method: str, params: Optional[list] = None):
+        """
+        Call a rpc method, can be awaited concurrently with other calls
+        @param method: method name
+        @param params: method parameters
+        @return: call result
+        """
+        if self._ws is None:
+            raise ConnectionError("not connected")
+        payload = make_payload(method, params, self.token, next(self._ids))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[payload["id"]] = future
+        logger.debug("Calling rpc method: {method}({params})".format(method=method, params=params))
+        await self._ws.send(json.dumps(payload))
+        return Aria2Client.check_resp(await future)
+
+    async def multicall(self, calls: list[tuple[str, list]]) -> list:
+        """
+        Call several methods in a single system.multicall request
+        @param calls: (method name, params) pairs
+        @return: results in the same order, failed calls are returned as RPCException
+        """
+        methods = []
+        for method, params in calls:
+            payload = make_payload(method, list(params), self.token, 0)
+            methods.append({"methodName": method, "params": payload.get("params", [])})
+        results = []
+        for result in await self.call("system.multicall", [methods]):
+            if isinstance(result, dict):
+                results.append(RPCException(result.get("code"), result.get("message")))
+            else:
+                results.append(result[0])
+        return results
+
+    async def add_uri(self, uris: list, options: Optional[dict] = None) -> str:
+        return await self.call("aria2.addUri", [uris, options or {}])
+
+    async def get_option(self, gid: str) -> dict:
+        return await self.call("aria2.getOption", [gid])
+
+    async def tell_status(self, gid: str, keys: Optional[list] = None) -> dict:
+        return await self.call("aria2.tellStatus", [gid, keys or []])
+
+    async def tell_active(self, keys: Optional[list] = None) -> list[dict]:
+        return await self.call("aria2.tellActive", [keys or []])
+
+    async def tell_waiting(self, offset: int, num: int, keys: Optional[list] = None) -> list[dict]:
+        return await self.call("aria2.tellWaiting", [offset, num, keys or []])
+
+    async def tell_stopped(self, offset: int, num: int, keys: Optional[list] = None) -> list[dict]:
+        return await self.call("aria2.tellStopped", [offset, num, keys or []])
+
+    async def remove_download_result(self, gid: str):
+        return await self.call("aria2.removeDownloadResult", [gid])
+
+    async def get_global_stat(self) -> dict:
+        return await self.call("aria2.getGlobalStat")
+
+    async def get_version(self) -> dict:
+        return await self.call("aria2.getVersion")
+
+    async def restart_download(self, gid: str, uri: Optional[str] = None) -> str:
+        """
+        Re-add a failed task and remove the old result
+        @param gid: gid of the failed task
+        @param uri: uri of the task if already known, saves a tellStatus
+        @return: new gid
+        """
+        if uri is None:
+            status, option = await asyncio.gather(self.tell_status(gid, ["files"]), self.get_option(gid))
+            uri = status["files"][0]["uris"][0]["uri"]
+        else:
+            option = await self.get_option(gid)
+        new_gid = await self.add_uri([uri], option)
+        await self.remove_download_result(gid)
+        return new_gid
+
+    async def restart_downloads(self, tasks: dict[str, str]) -> dict[str, str]:
+        """
+        Restart failed tasks with three multicalls, see Aria2Client.restart_downloads
+        @param tasks: gid -> uri to restart the failed task from, tried before its other uris
+        @return: old gid -> new gid mapping of the restarted tasks
+        """
+        if not tasks:
+            return {}
+        calls = []
+        for gid in tasks:
+            calls += [("aria2.tellStatus", [gid, ["status", "files"]]), ("aria2.getOption", [gid])]
+        results = await self.multicall(calls)
+
+        restart, calls = [], []
+        for (gid, uri), status, option in zip(tasks.items(), results[::2], results[1::2]):
+            error = next((r for r in (status, option) if isinstance(r, RPCException)), None)
+            if error is not None or status["status"] != "error":
+                logger.error(f"Cannot restart {gid}: {error or 'the task did not fail'}")
+                continue
+            restart.append(gid)
+            calls.append(("aria2.addUri", [restart_uris(uri, status), option]))
+        new_gids = await self.multicall(calls) if calls else []
+
+        restarted = {}
+        for gid, new_gid in zip(restart, new_gids):
+            if isinstance(new_gid, RPCException):
+                logger.error(f"Cannot restart {gid}: {new_gid}")
+                continue
+            restarted[gid] = new_gid
+        # only after the task was re-added, otherwise a failed addUri would lose it altogether
+        if restarted:
+            results = await self.multicall([("aria2.removeDownloadResult", [gid]) for gid in restarted])
+            for gid, result in zip(restarted, results):
+                if isinstance(result, RPCException):
+                    logger.warning(f"Failed to remove the result of {gid}: {result}")
+        return restarted
+
+    async def retry_all(self, gids: Optional[Container[str]] = None) -> dict[str, str]:
+        """
+        Restart all failed tasks with four requests, whatever the number of tasks
+        @param gids: only restart these tasks, e.g. the ones added by this process to a shared aria2
+        @return: old gid -> new gid mapping
+        """
+        stopped = await self.tell_stopped(0, 9999, ["gid", "status", "files"])
+        return await self.restart_downloads({task["gid"]: task["files"][0]["uris"][0]["uri"]
+                                             for task in stopped
+                                             if task["status"] == "error" and (gids is None or task["gid"] in gids)})
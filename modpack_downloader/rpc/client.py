@@ -1,11 +1,12 @@
+import itertools
 import logging
 import os
 import warnings
-from typing import Optional
+from typing import Container, Optional
 
 import requests
 
-__all__ = ["RPCException", "Aria2Client", "MulticallClient"]
+__all__ = ["RPCException", "Aria2Client", "MulticallClient", "make_payload", "restart_uris"]
 
 logger = logging.getLogger(os.path.basename(__file__))
 
@@ -19,10 +20,39 @@ class RPCException(Exception):
         return self.msg
 
 
+def make_payload(method: str, params: Optional[list], token: Optional[str], request_id: int) -> dict:
+    """Build a jsonrpc request, the token is prepended to the params of aria2.* methods"""
+    if params is None:
+        params = []
+    if token and method.startswith("aria2."):
+        params.insert(0, f"token:{token}")
+
+    payload = {
+        "jsonrpc": "2.0",
+        "method": method,
+        "id": request_id
+    }
+    if params:
+        payload["params"] = params
+    return payload
+
+
+def restart_uris(uri: str, status: dict) -> list[str]:
+    """
+    Uris to re-add a failed task with: uri first, then the other uris (mirrors) the task had, each once
+    @param status: tellStatus of the task with its files
+    """
+    uris = [entry["uri"] for file in status.get("files", [])[:1] for entry in file.get("uris", [])]
+    return list(dict.fromkeys([uri, *uris]))
+
+
 class Aria2Client:
     """
     jsonrpc client for aria2
     """
+    # status fields used by the downloader, aria2 serializes every field (including uri lists) if keys are omitted
+    TASK_KEYS = ["gid", "status", "totalLength", "completedLength", "downloadSpeed", "files", "errorMessage"]
+    PAGE_SIZE = 1000
 
     def __init__(self, host: str = "localhost", port: int = 6800, token: Optional[str] = None, session=None):
         """
@@ -36,6 +66,7 @@ class Aria2Client:
         self.host = host
         self.port = port
         self.token = token
+        self._ids = itertools.count(1)
 
     def __del__(self):
         self.session.close()
@@ -68,19 +99,7 @@ class Aria2Client:
         return self.check_resp(response)
 
     def get_payload(self, method: str, params: Optional[list] = None) -> dict:
-        if params is None:
-            params = []
-        if self.token and method.startswith("aria2."):
-            params.insert(0, f"token:{self.token}")
-
-        payload = {
-            "jsonrpc": "2.0",
-            "method": method,
-            "id": 0
-        }
-        if params:
-            payload["params"] = params
-        return payload
+        return make_payload(method, params, self.token, next(self._ids))
 
     def add_uri(self, uris: list, options: Optional[dict] = None):
         if options is None:
@@ -155,15 +174,90 @@ class Aria2Client:
         self.remove_download_result(gid)
         return new_gid
 
-    def retry_all(self):
-        stopped = self.tell_stopped(0, 9999)
-        for task in stopped:
-            if task["status"] != "error":
+    def restart_downloads(self, tasks: dict[str, str]) -> dict[str, str]:
+        """
+        Restart failed tasks in bulk with three multicalls: the first fetches status and options of the tasks, the
+        second re-adds the ones that actually failed with all their uris, the third removes the old results of the
+        tasks that were re-added. Tasks whose calls fail are logged and skipped
+        @param tasks: gid -> uri to restart the failed task from, tried before its other uris
+        @return: old gid -> new gid mapping of the restarted tasks
+        """
+        if not tasks:
+            return {}
+        multicall = MulticallClient(self)
+        for gid in tasks:
+            multicall.tell_status(gid, ["status", "files"])
+            multicall.get_option(gid)
+        results = multicall.multicall(raise_errors=False)
+
+        restart = []
+        for (gid, uri), status, option in zip(tasks.items(), results[::2], results[1::2]):
+            error = next((r for r in (status, option) if isinstance(r, RPCException)), None)
+            if error is not None or status["status"] != "error":
+                logger.error(f"Cannot restart {gid}: {error or 'the task did not fail'}")
+                continue
+            restart.append(gid)
+            multicall.add_uri(restart_uris(uri, status), option)
+        new_gids = multicall.multicall(raise_errors=False) if restart else []
+
+        restarted = {}
+        for gid, new_gid in zip(restart, new_gids):
+            if isinstance(new_gid, RPCException):
+                logger.error(f"Cannot restart {gid}: {new_gid}")
                 continue
-            self.restart_download(task["gid"])
+            restarted[gid] = new_gid
+            multicall.remove_download_result(gid)
+        # only after the task was re-added, otherwise a failed addUri would lose it altogether
+        if restarted:
+            for gid, result in zip(restarted, multicall.multicall(raise_errors=False)):
+                if isinstance(result, RPCException):
+                    logger.warning(f"Failed to remove the result of {gid}: {result}")
+        return restarted
+
+    def retry_all(self, gids: Optional[Container[str]] = None) -> dict[str, str]:
+        """
+        Restart all failed tasks with four requests, whatever the number of tasks
+        @param gids: only restart these tasks, e.g. the ones added by this process to a shared aria2
+        @return: old gid -> new gid mapping
+        """
+        stopped = self.tell_stopped(0, 9999, ["gid", "status", "files"])
+        return self.restart_downloads({task["gid"]: task["files"][0]["uris"][0]["uri"]
+                                       for task in stopped
+                                       if task["status"] == "error" and (gids is None or task["gid"] in gids)})
 
-    def get_all_downloads(self) -> list[dict]:
-        return self.tell_active() + self.tell_waiting(0, 9999) + self.tell_stopped(0, 9999)
+    def get_all_downloads(self, keys: Optional[list] = None, page_size: Optional[int] = None) -> list[dict]:
+        """
+        Snapshot of active, waiting and stopped tasks in as few requests as possible.
+        The first page of each queue is fetched in a single multicall together with the queue sizes, the remaining
+        pages (if any) in a second one.
+        @param keys: status fields to return, defaults to TASK_KEYS
+        @param page_size: number of tasks requested per tellWaiting/tellStopped call
+        """
+        if keys is None:
+            keys = self.TASK_KEYS
+        if page_size is None:
+            page_size = self.PAGE_SIZE
+
+        multicall = MulticallClient(self)
+        multicall.get_global_stat()
+        multicall.tell_active(list(keys))
+        multicall.tell_waiting(0, page_size, list(keys))
+        multicall.tell_stopped(0, page_size, list(keys))
+        stat, active, waiting, stopped = multicall.multicall()
+
+        num_waiting, num_stopped = int(stat["numWaiting"]), int(stat["numStopped"])
+        for offset in range(page_size, num_waiting, page_size):
+            multicall.tell_waiting(offset, page_size, list(keys))
+        for offset in range(page_size, num_stopped, page_size):
+            multicall.tell_stopped(offset, page_size, list(keys))
+        if multicall.call_list:
+            pages = multicall.multicall()
+            waiting_pages = len(range(page_size, num_waiting, page_size))
+            for page in pages[:waiting_pages]:
+                waiting += page
+            for page in pages[waiting_pages:]:
+                stopped += page
+        return active + waiting + stopped
 
 
 class MulticallClient(Aria2Client):
@@ -185,17 +279,20 @@ class MulticallClient(Aria2Client):
         self.call_list.append(payload)
         return payload
 
-    def multicall(self) -> list:
+    def multicall(self, raise_errors: bool = True) -> list:
         """
         Call multiple methods in the call list
-        @return: a list of call results (if success)
+        @param raise_errors: raise the first error, otherwise failed calls are returned as RPCException
+        @return: a list of call results
         """
         response = self.session.post(self.server, json=self.call_list).json()
         self.call_list = []
         results = []
         for r in response:
-            results.append(self.check_resp(r))
+            try:
+                results.append(self.check_resp(r))
+            except RPCException as e:
+                if raise_errors:
+                    raise
+                results.append(e)
         return results
-
-    def restart_download(self, gid: str):
-        raise NotImplementedError
@@ -1,42 +1,66 @@
-import json
+import asyncio
+import concurrent.futures
 import logging
 import os
+import threading
+from typing import Awaitable, Callable, Optional, TypeVar
 
-from PyQt6.QtCore import *
-from websockets.exceptions import ConnectionClosed
-from websockets.sync.client import connect
-
+from .async_client import AsyncAria2Client
 from .client import Aria2Client
+from ..utils.signals import Signal
 
 __all__ = ["Aria2EventListener"]
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+T = TypeVar("T")
+
 
-class Aria2EventListener(QThread):
-    onDownloadStart = pyqtSignal(str)
-    onDownloadPause = pyqtSignal(str)
-    onDownloadStop = pyqtSignal(str)
-    onDownloadComplete = pyqtSignal(str)
-    onDownloadError = pyqtSignal(str)
-    onBtDownloadComplete = pyqtSignal(str)
+class Aria2EventListener(threading.Thread):
+    """
+    Listens to aria2 notifications on a websocket connection.
+    The same connection can be used by other threads to send pipelined rpc calls, see submit().
+    """
+    onDownloadStart = Signal(str)
+    onDownloadPause = Signal(str)
+    onDownloadStop = Signal(str)
+    onDownloadComplete = Signal(str)
+    onDownloadError = Signal(str)
+    onBtDownloadComplete = Signal(str)
 
     def __init__(self, client: Aria2Client):
-        super().__init__()
+        super().__init__(name="Aria2EventListenerThread", daemon=True)
         self.client = client
+        self.rpc = AsyncAria2Client.from_client(client, self.process_notification)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connected = threading.Event()
 
     def run(self):
-        ws = connect(self.client.ws_server, ping_interval=None)
+        asyncio.run(self._listen())
+
+    async def _listen(self):
+        try:
+            await self.rpc.connect()
+        except OSError as e:
+            logger.error("Failed to connect to aria2", exc_info=e)
+            return
+        self.loop = asyncio.get_running_loop()
+        self._connected.set()
         logger.info("Started listening to notifications")
-        while True:
-            try:
-                msg = ws.recv()
-                self.process_notification(json.loads(msg))
-            except ConnectionClosed:
-                logger.warning("Connection closed")
-                return
-            except Exception as e:
-                logger.error("Unexpected error: %s", e)
+        await self.rpc.wait_closed()
+        self._connected.clear()
+
+    def submit(self, func: Callable[[AsyncAria2Client], Awaitable[T]],
+               timeout: Optional[float] = 5) -> concurrent.futures.Future[T]:
+        """
+        Run func(rpc) on the listener connection, safe to call from any thread
+        @param func: coroutine function taking the async client
+        @param timeout: how long to wait for the connection
+        @return: future of the result
+        """
+        if not self._connected.wait(timeout):
+            raise ConnectionError("not connected to aria2")
+        return asyncio.run_coroutine_threadsafe(func(self.rpc), self.loop)
 
     def process_notification(self, msg: dict):
         event = msg["method"]
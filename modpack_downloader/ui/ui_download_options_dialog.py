@@ -29,7 +29,6 @@ class Ui_DownloadOptionsDialog(object):
         self.buttonGroup.addButton(self.radioButton_cf_local)
         self.horizontalLayout.addWidget(self.radioButton_cf_local)
         self.radioButton_cf_online = QtWidgets.QRadioButton(parent=DownloadOptionsDialog)
-        self.radioButton_cf_online.setEnabled(False)
         self.radioButton_cf_online.setObjectName("radioButton_cf_online")
         self.buttonGroup.addButton(self.radioButton_cf_online)
         self.horizontalLayout.addWidget(self.radioButton_cf_online)
@@ -37,6 +36,10 @@ class Ui_DownloadOptionsDialog(object):
         self.radioButton_ftb.setObjectName("radioButton_ftb")
         self.buttonGroup.addButton(self.radioButton_ftb)
         self.horizontalLayout.addWidget(self.radioButton_ftb)
+        self.radioButton_modrinth = QtWidgets.QRadioButton(parent=DownloadOptionsDialog)
+        self.radioButton_modrinth.setObjectName("radioButton_modrinth")
+        self.buttonGroup.addButton(self.radioButton_modrinth)
+        self.horizontalLayout.addWidget(self.radioButton_modrinth)
         self.verticalLayout.addLayout(self.horizontalLayout)
         self.stackedWidget = QtWidgets.QStackedWidget(parent=DownloadOptionsDialog)
         self.stackedWidget.setFrameShape(QtWidgets.QFrame.Shape.NoFrame)
@@ -59,6 +62,21 @@ class Ui_DownloadOptionsDialog(object):
         self.stackedWidget.addWidget(self.page_1)
         self.page_2 = QtWidgets.QWidget()
         self.page_2.setObjectName("page_2")
+        self.gridLayout_2 = QtWidgets.QGridLayout(self.page_2)
+        self.gridLayout_2.setObjectName("gridLayout_2")
+        self.label_6 = QtWidgets.QLabel(parent=self.page_2)
+        self.label_6.setObjectName("label_6")
+        self.gridLayout_2.addWidget(self.label_6, 0, 0, 1, 1)
+        self.lineEdit_cf_project = QtWidgets.QLineEdit(parent=self.page_2)
+        self.lineEdit_cf_project.setObjectName("lineEdit_cf_project")
+        self.gridLayout_2.addWidget(self.lineEdit_cf_project, 0, 1, 1, 1)
+        self.label_7 = QtWidgets.QLabel(parent=self.page_2)
+        self.label_7.setObjectName("label_7")
+        self.gridLayout_2.addWidget(self.label_7, 1, 0, 1, 1)
+        self.spinBox_cf_file_id = QtWidgets.QSpinBox(parent=self.page_2)
+        self.spinBox_cf_file_id.setMaximum(999999999)
+        self.spinBox_cf_file_id.setObjectName("spinBox_cf_file_id")
+        self.gridLayout_2.addWidget(self.spinBox_cf_file_id, 1, 1, 1, 1)
         self.stackedWidget.addWidget(self.page_2)
         self.page_3 = QtWidgets.QWidget()
         self.page_3.setObjectName("page_3")
@@ -79,6 +97,32 @@ class Ui_DownloadOptionsDialog(object):
         self.label_4.setObjectName("label_4")
         self.gridLayout.addWidget(self.label_4, 1, 0, 1, 1)
         self.stackedWidget.addWidget(self.page_3)
+        self.page_4 = QtWidgets.QWidget()
+        self.page_4.setObjectName("page_4")
+        self.gridLayout_3 = QtWidgets.QGridLayout(self.page_4)
+        self.gridLayout_3.setObjectName("gridLayout_3")
+        self.label_8 = QtWidgets.QLabel(parent=self.page_4)
+        self.label_8.setObjectName("label_8")
+        self.gridLayout_3.addWidget(self.label_8, 0, 0, 1, 1)
+        self.lineEdit_mrpack_file = QtWidgets.QLineEdit(parent=self.page_4)
+        self.lineEdit_mrpack_file.setObjectName("lineEdit_mrpack_file")
+        self.gridLayout_3.addWidget(self.lineEdit_mrpack_file, 0, 1, 1, 1)
+        self.toolButton_browse_mrpack = QtWidgets.QToolButton(parent=self.page_4)
+        self.toolButton_browse_mrpack.setObjectName("toolButton_browse_mrpack")
+        self.gridLayout_3.addWidget(self.toolButton_browse_mrpack, 0, 2, 1, 1)
+        self.label_9 = QtWidgets.QLabel(parent=self.page_4)
+        self.label_9.setObjectName("label_9")
+        self.gridLayout_3.addWidget(self.label_9, 1, 0, 1, 1)
+        self.lineEdit_mr_project = QtWidgets.QLineEdit(parent=self.page_4)
+        self.lineEdit_mr_project.setObjectName("lineEdit_mr_project")
+        self.gridLayout_3.addWidget(self.lineEdit_mr_project, 1, 1, 1, 2)
+        self.label_10 = QtWidgets.QLabel(parent=self.page_4)
+        self.label_10.setObjectName("label_10")
+        self.gridLayout_3.addWidget(self.label_10, 2, 0, 1, 1)
+        self.lineEdit_mr_version = QtWidgets.QLineEdit(parent=self.page_4)
+        self.lineEdit_mr_version.setObjectName("lineEdit_mr_version")
+        self.gridLayout_3.addWidget(self.lineEdit_mr_version, 2, 1, 1, 2)
+        self.stackedWidget.addWidget(self.page_4)
         self.verticalLayout.addWidget(self.stackedWidget)
         self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_3.setContentsMargins(0, 0, 0, 0)
@@ -98,10 +142,30 @@ class Ui_DownloadOptionsDialog(object):
         self.toolButton_browse_save_dir.setObjectName("toolButton_browse_save_dir")
         self.horizontalLayout_3.addWidget(self.toolButton_browse_save_dir)
         self.verticalLayout.addLayout(self.horizontalLayout_3)
+        self.horizontalLayout_4 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_4.setContentsMargins(0, 0, 0, 0)
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.label_11 = QtWidgets.QLabel(parent=DownloadOptionsDialog)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.label_11.sizePolicy().hasHeightForWidth())
+        self.label_11.setSizePolicy(sizePolicy)
+        self.label_11.setObjectName("label_11")
+        self.horizontalLayout_4.addWidget(self.label_11)
+        self.lineEdit_launcher_dir = QtWidgets.QLineEdit(parent=DownloadOptionsDialog)
+        self.lineEdit_launcher_dir.setObjectName("lineEdit_launcher_dir")
+        self.horizontalLayout_4.addWidget(self.lineEdit_launcher_dir)
+        self.toolButton_browse_launcher_dir = QtWidgets.QToolButton(parent=DownloadOptionsDialog)
+        self.toolButton_browse_launcher_dir.setObjectName("toolButton_browse_launcher_dir")
+        self.horizontalLayout_4.addWidget(self.toolButton_browse_launcher_dir)
+        self.verticalLayout.addLayout(self.horizontalLayout_4)
         self.checkBox_multimc = QtWidgets.QCheckBox(parent=DownloadOptionsDialog)
-        self.checkBox_multimc.setEnabled(False)
         self.checkBox_multimc.setObjectName("checkBox_multimc")
         self.verticalLayout.addWidget(self.checkBox_multimc)
+        self.checkBox_update_instance = QtWidgets.QCheckBox(parent=DownloadOptionsDialog)
+        self.checkBox_update_instance.setObjectName("checkBox_update_instance")
+        self.verticalLayout.addWidget(self.checkBox_update_instance)
         self.buttonBox = QtWidgets.QDialogButtonBox(parent=DownloadOptionsDialog)
         self.buttonBox.setOrientation(QtCore.Qt.Orientation.Horizontal)
         self.buttonBox.setStandardButtons(QtWidgets.QDialogButtonBox.StandardButton.Cancel|QtWidgets.QDialogButtonBox.StandardButton.Ok)
@@ -121,10 +185,26 @@ class Ui_DownloadOptionsDialog(object):
         self.radioButton_cf_local.setText(_translate("DownloadOptionsDialog", "Curseforge (local)"))
         self.radioButton_cf_online.setText(_translate("DownloadOptionsDialog", "Curseforge (online)"))
         self.radioButton_ftb.setText(_translate("DownloadOptionsDialog", "FTB"))
+        self.radioButton_modrinth.setText(_translate("DownloadOptionsDialog", "Modrinth"))
         self.label_2.setText(_translate("DownloadOptionsDialog", "Modpack file:"))
         self.toolButton_browse_file.setText(_translate("DownloadOptionsDialog", "..."))
+        self.label_6.setText(_translate("DownloadOptionsDialog", "Project ID or slug:"))
+        self.label_7.setText(_translate("DownloadOptionsDialog", "File ID:"))
+        self.spinBox_cf_file_id.setToolTip(_translate("DownloadOptionsDialog", "0 to download the latest file"))
         self.label_3.setText(_translate("DownloadOptionsDialog", "Modpack ID:"))
         self.label_4.setText(_translate("DownloadOptionsDialog", "Version ID:"))
+        self.label_8.setText(_translate("DownloadOptionsDialog", "Modpack file:"))
+        self.lineEdit_mrpack_file.setPlaceholderText(_translate("DownloadOptionsDialog", ".mrpack file, or leave empty and enter a project"))
+        self.toolButton_browse_mrpack.setText(_translate("DownloadOptionsDialog", "..."))
+        self.label_9.setText(_translate("DownloadOptionsDialog", "Project ID or slug:"))
+        self.label_10.setText(_translate("DownloadOptionsDialog", "Version ID:"))
+        self.lineEdit_mr_version.setPlaceholderText(_translate("DownloadOptionsDialog", "latest"))
         self.label_5.setText(_translate("DownloadOptionsDialog", "Save to:"))
         self.toolButton_browse_save_dir.setText(_translate("DownloadOptionsDialog", "..."))
+        self.label_11.setText(_translate("DownloadOptionsDialog", "Install into launcher:"))
+        self.lineEdit_launcher_dir.setToolTip(_translate("DownloadOptionsDialog", "Instances folder of MultiMC or Prism Launcher, the modpack is added as an instance once downloaded"))
+        self.lineEdit_launcher_dir.setPlaceholderText(_translate("DownloadOptionsDialog", "MultiMC/Prism instances folder (optional)"))
+        self.toolButton_browse_launcher_dir.setText(_translate("DownloadOptionsDialog", "..."))
         self.checkBox_multimc.setText(_translate("DownloadOptionsDialog", "Save as MultiMC pack"))
+        self.checkBox_update_instance.setToolTip(_translate("DownloadOptionsDialog", "Treat the save directory as the minecraft dir of an installed instance and only download changed files"))
+        self.checkBox_update_instance.setText(_translate("DownloadOptionsDialog", "Update an existing instance"))
@@ -0,0 +1,139 @@
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import time
+from configparser import ConfigParser
+from typing import Optional
+
+from packaging.version import Version
+
+from ..rpc.client import Aria2Client
+
+__all__ = ["MIN_ARIA2_VERSION", "Aria2Error", "read_aria2_conf", "find_aria2", "Aria2Process"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+MIN_ARIA2_VERSION = Version("1.37.0")
+
+
+class Aria2Error(Exception):
+    pass
+
+
+def read_aria2_conf(conf_file: str) -> dict[str, str]:
+    """Parse an aria2 config file (key=value lines without sections)"""
+    parser = ConfigParser()
+    with open(conf_file) as f:
+        parser.read_string("[DEFAULT]\n" + f.read())
+    return dict(parser["DEFAULT"])
+
+
+def find_aria2() -> Optional[str]:
+    if os.name == "nt":
+        return shutil.which("aria2c.exe")
+    return shutil.which("aria2c")
+
+
+class Aria2Process:
+    """
+    An aria2c subprocess started with a config file, stopped together with this process.
+    Can also attach to an aria2 daemon already listening on the configured rpc port, or start one that keeps running
+    after this process exits, so that later runs skip the startup.
+    """
+    START_TIMEOUT = 10
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, conf_file: str, executable: Optional[str] = None, extra_args: Optional[list[str]] = None,
+                 host: str = "localhost", daemon: bool = False):
+        """
+        @param conf_file: aria2 config file, rpc-listen-port and rpc-secret are read from it
+        @param executable: aria2c executable, looked up in PATH by default
+        @param extra_args: extra command line arguments
+        @param host: rpc host, only used to attach to a running aria2
+        @param daemon: don't stop aria2 when this process exits
+        """
+        self.conf_file = conf_file
+        self.conf = read_aria2_conf(conf_file)
+        self.executable = executable or find_aria2()
+        self.host = host
+        self.daemon = daemon
+        self.args = ["--conf-path", conf_file] + (extra_args or [])
+        if not daemon:
+            self.args += ["--stop-with-process", str(os.getpid())]
+        self.process: Optional[subprocess.Popen] = None
+        # whether aria2 was already running
+        self.attached = False
+
+    @property
+    def port(self) -> int:
+        return int(self.conf.get("rpc-listen-port", "6800"))
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.conf.get("rpc-secret")
+
+    def listening(self) -> bool:
+        """Whether something accepts connections on the rpc port"""
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.POLL_INTERVAL * 5):
+                return True
+        except OSError:
+            return False
+
+    def start(self, attach: bool = False):
+        """
+        Start aria2 and wait until its rpc port accepts connections
+        @param attach: use the aria2 already listening on the rpc port if there is one
+        """
+        if attach and self.listening():
+            logger.info(f"Attaching to aria2 running on {self.host}:{self.port}")
+            self.attached = True
+            return
+        if self.executable is None:
+            raise Aria2Error("Aria2 executable not found, please install aria2")
+
+        logger.info(f"Starting {self.executable}")
+        try:
+            self.process = subprocess.Popen([self.executable] + self.args, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                            start_new_session=self.daemon)
+        except OSError as e:
+            raise Aria2Error("Failed to start aria2") from e
+        self.wait_ready()
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """Poll the rpc port until aria2 listens on it"""
+        deadline = time.monotonic() + (timeout or self.START_TIMEOUT)
+        while not self.listening():
+            if self.process is not None and self.process.poll() is not None:
+                raise Aria2Error(f"aria2 exited with code {self.process.returncode}, check {self.conf_file}")
+            if time.monotonic() > deadline:
+                raise Aria2Error(f"aria2 didn't open rpc port {self.port} in time")
+            time.sleep(self.POLL_INTERVAL)
+        logger.info("aria2 is ready")
+
+    @property
+    def shared(self) -> bool:
+        """Whether aria2 outlives this process and may be used by others, so it must not be shut down"""
+        return self.attached or self.daemon
+
+    def client(self, session=None) -> Aria2Client:
+        """Create a client for this aria2 instance and make sure its version is supported"""
+        client = Aria2Client(host=self.host, port=self.port, token=self.token, session=session)
+        try:
+            version = Version(client.get_version()["version"])
+        except Exception as e:
+            raise Aria2Error("Failed to get aria2 version") from e
+
+        logger.info(f"Aria2 version: {version}")
+        if version < MIN_ARIA2_VERSION:
+            raise Aria2Error(f"Aria2 below {MIN_ARIA2_VERSION} (currently installed {version}) wont work.\n"
+                             "Please upgrade aria2.")
+        return client
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait for the aria2 started by start() to exit, returns at once if it is shared"""
+        if self.process is not None and not self.shared:
+            self.process.wait(timeout)
@@ -1,9 +1,60 @@
+import os
+
 CF_GET_FILES_URL = "https://api.curseforge.com/v1/mods/files"
 CF_GET_MODS_URL = "https://api.curseforge.com/v1/mods"
+CF_SEARCH_MODS_URL = "https://api.curseforge.com/v1/mods/search"
+CF_GAME_ID = 432
+CF_MODPACK_CLASS_ID = 4471
 
 FTB_MODPACK_MF_URL = "https://api.feed-the-beast.com/v1/modpacks/public/modpack/{0}"
 FTB_VERSION_MF_URL = "https://api.feed-the-beast.com/v1/modpacks/public/modpack/{0}/{1}"
 
+MODRINTH_PROJECT_VERSIONS_URL = "https://api.modrinth.com/v2/project/{0}/version"
+MODRINTH_VERSION_URL = "https://api.modrinth.com/v2/version/{0}"
+# modrinth asks clients to identify themselves
+MODRINTH_UA = "c6ForH66/ModpackDownloader"
+
 OVERWOLF_UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.141 "
                "Safari/537.36 OverwolfClient/0.190.0.13")
 
+
+CACHE_DIR = os.environ.get("MODPACK_DOWNLOADER_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "modpack_downloader"))
+MOD_CACHE_DIR = os.path.join(CACHE_DIR, "mods")
+MOD_CACHE_MAX_SIZE = 20 << 30
+
+METADATA_CACHE_FILE = os.path.join(CACHE_DIR, "metadata.sqlite")
+# a curseforge file never changes once it's published, projects may move to another class (e.g. mod -> shader)
+CF_FILE_TTL = 30 * 24 * 3600
+CF_MOD_TTL = 7 * 24 * 3600
+
+CF_BULK_CHUNK_SIZE = 100
+CF_BULK_WORKERS = 8
+CF_RETRIES = 4
+CF_RETRY_BACKOFF = 0.5
+
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_RETRY_DELAY = 2
+DOWNLOAD_RETRY_MAX_DELAY = 120
+# retries running at the same time against one host, the rest wait for a slot
+DOWNLOAD_RETRIES_PER_HOST = 8
+# host -> alternate hosts serving the same paths, more can be added with the MODPACK_DOWNLOADER_MIRRORS environment
+# variable, e.g. "edge.forgecdn.net=mirror.example.com;other.host=mirror1,mirror2"
+DOWNLOAD_MIRRORS = {"edge.forgecdn.net": ["mediafilez.forgecdn.net"]}
+
+# files are split into one aria2 connection per DOWNLOAD_SPLIT_SIZE bytes, up to DOWNLOAD_MAX_SPLIT (aria2 refuses
+# more than 16 connections per server)
+DOWNLOAD_SPLIT_SIZE = 4 << 20
+DOWNLOAD_MAX_SPLIT = 16
+# files at least this large are queued before everything else so that they don't end up as the tail of the download
+DOWNLOAD_LARGE_FILE = 64 << 20
+
+# files handed to aria2 at the same time, the rest is added as they finish. Twice max-concurrent-downloads of the
+# bundled aria2.conf, so aria2 always has files waiting when a slot frees up
+DOWNLOAD_WINDOW = 512
+
+# journals of unfinished downloads, used to resume them after a restart
+SESSION_DIR = os.path.join(CACHE_DIR, "sessions")
+
+# threads extracting the overrides of a modpack, zlib and file io release the GIL
+EXTRACT_WORKERS = 8
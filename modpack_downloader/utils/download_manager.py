@@ -1,138 +1,629 @@
 import functools
+import heapq
 import logging
 import os
+import queue
 import re
-from typing import Literal
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
 
-from PyQt6.QtCore import *
-from pydantic import BaseModel, ConfigDict, field_validator, TypeAdapter
+from pydantic import BaseModel, ConfigDict
 
-from ..rpc.client import Aria2Client, MulticallClient
+from ..rpc.client import Aria2Client, MulticallClient, RPCException
 from ..rpc.event_listener import Aria2EventListener
+from .constants import DOWNLOAD_WINDOW
+from .download_priority import prioritize
+from .foreground_task import ForegroundTask
+from .hash_index import HashIndex
+from .local_verifier import find_missing
+from .mod_cache import ModCache
+from .retry_scheduler import RetryScheduler
+from .signals import Signal
+from .task_store import TaskStore
 
 logger = logging.getLogger(os.path.basename(__file__))
 
 
 class DownloadOptions(BaseModel):
-    model_config = ConfigDict(alias_generator=lambda field_name: re.sub("_", "-", field_name))
+    model_config = ConfigDict(alias_generator=lambda field_name: re.sub("_", "-", field_name), populate_by_name=True)
     url: str
     dir: str
     out: str = ""
     checksum: str = ""
+    # size from the manifest, 0 if unknown. Not an aria2 option, used to schedule the download
+    size: int = 0
+    # more urls of the same file, aria2 falls back to them when url fails. Not an aria2 option either
+    mirrors: list[str] = []
+    split: Optional[int] = None
+    max_connection_per_server: Optional[int] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.dir, self.out or os.path.basename(self.url))
+
+    def aria2_options(self) -> dict:
+        # aria2 only accepts string option values
+        options = self.model_dump(exclude={"url", "size", "mirrors"}, exclude_defaults=True, by_alias=True)
+        return {key: str(value) for key, value in options.items()}
 
 
-class A2Task(BaseModel):
-    gid: str
-    status: Literal["active", "waiting", "paused", "error", "complete", "removed"] = "waiting"
-    totalLength: int = 0
-    completedLength: int = 0
-    downloadSpeed: int = 0
-    files: list = []
-    errorMessage: str = ""
+@dataclass
+class PackDownload:
+    """Download state of one modpack"""
+    name: str
+    total: int
+    completed: int = 0
+    gids: set[str] = field(default_factory=set)
+    failed: set[str] = field(default_factory=set)
+    # background jobs (e.g. override extraction) still running, and the errors of those that failed
+    jobs: int = 0
+    job_errors: list[str] = field(default_factory=list)
+    # failed jobs, run again by retry_all
+    failed_jobs: list[ForegroundTask] = field(default_factory=list)
+    # files aria2 refused to add, queued again by retry_all
+    rejected: list[DownloadOptions] = field(default_factory=list)
+    hash_index: Optional[HashIndex] = None
 
     @property
-    def name(self):
-        return os.path.basename(self.files[0]["path"])
+    def complete(self) -> bool:
+        return self.completed == self.total and self.jobs == 0 and not self.job_errors
 
     @property
-    def progress(self) -> int:
-        if self.status == "complete":
-            return 100
-        if self.totalLength == 0:
-            return 0
-        return int(self.completedLength / self.totalLength * 100)
+    def finished(self) -> bool:
+        return self.completed + len(self.failed) + len(self.rejected) >= self.total and self.jobs == 0
 
-    # noinspection PyNestedDecorators
-    field_validator("totalLength", "completedLength", "downloadSpeed", mode="before")(lambda x: int(x))
+    @property
+    def failures(self) -> int:
+        return len(self.failed) + len(self.rejected) + len(self.job_errors)
 
 
-class DownloadManager(QObject):
-    RETRY_INTERVAL = 5000
-    UPDATE_INTERVAL = 200
+class DownloadManager:
+    """
+    Feeds modpack files to aria2 and keeps track of their state.
+    Several modpacks can be downloaded at the same time, each one is identified by a pack id.
+    All methods must be called on the thread running run(), use post() from other threads.
+    """
+    UPDATE_INTERVAL = 0.2
+    MAX_JOBS = 4
+    RPC_TIMEOUT = 30
+    # delay before files are handed to aria2 again after the rpc call adding them failed
+    FEED_RETRY_DELAY = 2
 
-    task_updated = pyqtSignal()
-    download_complete = pyqtSignal()
-    progress_changed = pyqtSignal(int, int)
+    # rows of task_list that changed since the last emit
+    task_updated = Signal(list)
+    # emitted when every modpack finished downloading
+    download_complete = Signal()
+    progress_changed = Signal(int, int)
+    mod_failed = Signal(str)
 
-    _ta = TypeAdapter(list[A2Task])
+    pack_progress = Signal(str, int, int)
+    # pack id, status and progress of a background job of the pack, throttled like the task updates
+    job_progress = Signal(str, str, int, int)
+    pack_complete = Signal(str)
+    # emitted when every file and job of a pack either succeeded or gave up, with the number of failures
+    pack_failed = Signal(str, int)
 
-    start = pyqtSignal(list)
-    stop = pyqtSignal()
+    # fields polled for active tasks, everything else is pushed by aria2 notifications
+    ACTIVE_KEYS = ["gid", "status", "totalLength", "completedLength", "downloadSpeed"]
 
-    def __init__(self, client: Aria2Client, event_listener: Aria2EventListener):
-        super().__init__()
+    def __init__(self, client: Aria2Client, event_listener: Aria2EventListener, mod_cache: Optional[ModCache] = None,
+                 retry_scheduler: Optional[RetryScheduler] = None, shared: bool = False,
+                 window: int = DOWNLOAD_WINDOW):
+        """
+        @param shared: aria2 is a daemon that other processes may use too, it is left running on shutdown, its
+        download results are not purged and only the tasks of this manager are retried
+        @param window: files handed to aria2 at the same time, the others wait in the backlog until some finish
+        """
         self.client = client
-        self.multicall = MulticallClient(self.client)
+        self.shared = shared
+        self.window = window
         self.event_listener = event_listener
-        self.downloading = False
-        self.timer = QTimer()
-        self.task_list: list[A2Task] = []
-        self.event_listener.onDownloadComplete.connect(self.mod_complete)
-        self.event_listener.onDownloadError.connect(self.download_error)
-        self.stop.connect(self.shutdown)
-        self.start.connect(self.start_download_modpack)
+        self.mod_cache = mod_cache
+        self.task_list = TaskStore()
+        self.event_listener.onDownloadStart.connect(functools.partial(self.post, self._task_event, "active"))
+        self.event_listener.onDownloadPause.connect(functools.partial(self.post, self._task_event, "paused"))
+        self.event_listener.onDownloadStop.connect(functools.partial(self.post, self._task_event, "removed"))
+        self.event_listener.onDownloadComplete.connect(functools.partial(self.post, self.mod_complete))
+        self.event_listener.onDownloadError.connect(functools.partial(self.post, self.download_error))
         self.total_mods = 0
         self.completed_mods = 0
-        self.retry_counter = {}
+        self.retry_scheduler = retry_scheduler or RetryScheduler()
+        # attempts and current url of every file that failed at least once, keyed by path
+        self.retry_counter: dict[str, int] = {}
+        self.retry_urls: dict[str, str] = {}
+        # restarted gid -> url, holding a retry slot of its host until it completes or fails
+        self.retrying: dict[str, str] = {}
+        self.gid_task: dict[str, DownloadOptions] = {}
+        self.packs: dict[str, PackDownload] = {}
+        self.gid_pack: dict[str, str] = {}
+        # (pack id, file) not handed to aria2 yet
+        self.backlog: deque[tuple[str, DownloadOptions]] = deque()
+        self._feeding = False
+        self._job_pool = ThreadPoolExecutor(max_workers=self.MAX_JOBS, thread_name_prefix="PackJobThread")
+
+        self._events = queue.Queue()
+        self._timers = []
+        self._timer_seq = 0
+        self._running = False
+        self._ticking = False
+
+    def post(self, func: Callable, *args):
+        """Schedule func(*args) on the manager thread, safe to call from any thread"""
+        self._events.put((func, args))
+
+    def call_later(self, delay: float, func: Callable, *args):
+        """Schedule func(*args) on the manager thread after delay seconds"""
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_seq, func, args))
 
     def run(self):
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.refresh_data)
+        """Process posted calls and timers until shutdown() is called"""
+        self._running = True
+        while self._running:
+            timeout = max(0.0, self._timers[0][0] - time.monotonic()) if self._timers else None
+            try:
+                func, args = self._events.get(timeout=timeout)
+                self._invoke(func, args)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            while self._running and self._timers and self._timers[0][0] <= now:
+                _, _, func, args = heapq.heappop(self._timers)
+                self._invoke(func, args)
+
+    @staticmethod
+    def _invoke(func: Callable, args: tuple):
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Unexpected error in {getattr(func, '__name__', func)}", exc_info=e)
 
-    @pyqtSlot(list)
-    def start_download_modpack(self, modlist: list[DownloadOptions]):
-        logger.info("Starting download")
-        if self.downloading:
-            logger.warning("already downloading a modpack!")
+    @property
+    def downloading(self) -> bool:
+        return bool(self.packs)
+
+    def add_modpack(self, pack_id: str, modlist: list[DownloadOptions], name: str = "",
+                    jobs: Iterable[ForegroundTask] = (), hash_index: Optional[HashIndex] = None):
+        """
+        Start downloading a modpack, can be called while other modpacks are downloading
+        @param pack_id: unique id used in pack_* signals
+        @param modlist: files to download
+        @param name: name used in logs
+        @param jobs: tasks run on a worker thread while the files download, the pack completes once they are done
+        @param hash_index: hash index of the minecraft dir, kept up to date with downloaded files and closed once the
+        pack completes
+        """
+        logger.info(f"Starting download {name}")
+        if pack_id in self.packs:
+            logger.warning(f"{pack_id} is already downloading!")
             return
-        self.client.purge_download_result()
-        self.completed_mods = 0
-        self.total_mods = len(modlist)
-        self.retry_counter = {}
-        for task in modlist:
-            self.multicall.add_uri([task.url], task.dict(exclude={"url"}, exclude_defaults=True))
-        self.multicall.multicall()
-        self.timer.start(self.UPDATE_INTERVAL)
-        self.downloading = True
+        if not self.downloading:
+            if not self.shared:
+                self.client.purge_download_result()
+            self.task_list.clear()
+            self.total_mods = 0
+            self.completed_mods = 0
+            self.retry_counter = {}
+            self.retry_urls = {}
+            self.backlog.clear()
+
+        pack = PackDownload(name=name or pack_id, total=len(modlist), hash_index=hash_index)
+        self.packs[pack_id] = pack
+        self.total_mods += pack.total
+        self._submit_jobs(pack_id, jobs)
+        if modlist:
+            self._job_pool.submit(self._verify_local, pack_id, modlist, hash_index)
+        self._pack_updated(pack_id)
+
+    def _verify_local(self, pack_id: str, modlist: list[DownloadOptions], hash_index: Optional[HashIndex]):
+        """
+        Skip files already on disk or in the mod cache, called on a worker thread.
+        Cache hits may have to be copied (cache on another filesystem), which must not block the manager thread
+        """
+        try:
+            missing = find_missing(modlist, index=hash_index)
+        except Exception as e:
+            logger.error("Failed to check local files", exc_info=e)
+            missing = modlist
+        pending = []
+        for task in missing:
+            if self._fetch_cached(task):
+                self._index_file(hash_index, task)
+            else:
+                pending.append(task)
+        self.post(self._enqueue, pack_id, pending)
+
+    def _enqueue(self, pack_id: str, pending: list[DownloadOptions]):
+        """Queue the files of a pack that are neither on disk nor in the mod cache"""
+        pack = self.packs.get(pack_id)
+        if pack is None:
+            return
+        completed = pack.total - len(pending)
+        pack.completed += completed
+        self.completed_mods += completed
+        logger.info(f"{completed}/{pack.total} files of {pack.name} found on disk or in mod cache")
+
+        if pending:
+            self.backlog.extend((pack_id, task) for task in prioritize(pending))
+            self._feed()
+            if not self._ticking:
+                self._ticking = True
+                self.call_later(self.UPDATE_INTERVAL, self._tick)
+
+        self._pack_updated(pack_id)
+
+    @property
+    def in_flight(self) -> int:
+        """Files in aria2 that neither completed nor gave up"""
+        return sum(len(pack.gids) - len(pack.failed) for pack in self.packs.values())
+
+    def _schedule_feed(self):
+        """Top up aria2 once the events already queued are processed, so that several free slots are filled at once"""
+        if self.backlog and not self._feeding:
+            self._feeding = True
+            self.post(self._feed)
+
+    def _feed(self):
+        """Move files from the backlog to aria2 until the window is full"""
+        self._feeding = False
+        batch = []
+        for _ in range(min(self.window - self.in_flight, len(self.backlog))):
+            pack_id, task = self.backlog.popleft()
+            if pack_id in self.packs:
+                batch.append((pack_id, task))
+        if not batch:
+            return
+
+        try:
+            results = self._add_tasks([task for _, task in batch])
+        except (OSError, ValueError, RPCException) as e:
+            # nothing was added, the files go back to the front of the backlog
+            logger.error(f"Failed to add {len(batch)} files, retrying in {self.FEED_RETRY_DELAY}s: {e}")
+            self.backlog.extendleft(reversed(batch))
+            self.call_later(self.FEED_RETRY_DELAY, self._schedule_feed)
+            return
+
+        added = []
+        for result, (pack_id, task) in zip(results, batch):
+            if isinstance(result, RPCException):
+                self._reject(pack_id, task, result)
+                continue
+            self.gid_task[result] = task
+            self.gid_pack[result] = pack_id
+            self.packs[pack_id].gids.add(result)
+            added.append((result, task.path))
+        self.task_list.add(added)
+
+    def _add_tasks(self, tasks: list[DownloadOptions]) -> list:
+        """
+        Queue files in a single multicall
+        @return: gid of every file, or the RPCException of a file aria2 refused
+        """
+        multicall = MulticallClient(self.client)
+        for task in tasks:
+            multicall.add_uri([task.url, *task.mirrors], task.aria2_options())
+        return multicall.multicall(raise_errors=False)
+
+    def _reject(self, pack_id: str, task: DownloadOptions, error: RPCException):
+        """Count a file aria2 refused as failed, it has no gid to retry"""
+        logger.error(f"aria2 refused {task.url}: {error}")
+        self.packs[pack_id].rejected.append(task)
+        self._pack_updated(pack_id)
+
+    def _pack_updated(self, pack_id: str):
+        pack = self.packs[pack_id]
+        self.pack_progress.emit(pack_id, pack.completed, pack.total)
+        self.progress_changed.emit(self.completed_mods, self.total_mods)
+        if pack.complete:
+            logger.info(f"{pack.name} download complete")
+            del self.packs[pack_id]
+            if pack.hash_index is not None:
+                pack.hash_index.close()
+            self.pack_complete.emit(pack_id)
+            if not self.downloading:
+                logger.info("download complete")
+                self.resync()
+                self.download_complete.emit()
+        elif pack.finished:
+            logger.error(f"{len(pack.failed) + len(pack.rejected)} files of {pack.name} failed to download, "
+                         f"{len(pack.job_errors)} jobs failed")
+            self.pack_failed.emit(pack_id, pack.failures)
+
+    def _submit_jobs(self, pack_id: str, jobs: Iterable[ForegroundTask]):
+        pack = self.packs[pack_id]
+        for job in jobs:
+            pack.jobs += 1
+            self._job_pool.submit(self._run_job, pack_id, job)
+
+    def _run_job(self, pack_id: str, job: ForegroundTask):
+        """Run a background job of a pack, called on a worker thread"""
+        errors = []
+        status = type(job).__name__
+        last_emit = 0.0
+
+        def progress(completed: int, total: int):
+            nonlocal last_emit
+            now = time.monotonic()
+            if completed >= total or now - last_emit >= self.UPDATE_INTERVAL:
+                last_emit = now
+                self.post(self.job_progress.emit, pack_id, status, completed, total)
+
+        def set_status(message: str):
+            nonlocal status
+            status = message
+
+        job.failed.connect(errors.append)
+        job.status.connect(set_status)
+        job.progress_changed.connect(progress)
+        try:
+            job.run()
+        except Exception as e:
+            logger.error(f"Unexpected error in {type(job).__name__}", exc_info=e)
+            errors.append(str(e))
+        finally:
+            # failed jobs are run again by retry_all
+            job.failed.disconnect(errors.append)
+            job.status.disconnect(set_status)
+            job.progress_changed.disconnect(progress)
+        self.post(self._job_done, pack_id, job, errors[0] if errors else None)
+
+    def _job_done(self, pack_id: str, job: ForegroundTask, error: Optional[str]):
+        if pack_id not in self.packs:
+            return
+        pack = self.packs[pack_id]
+        pack.jobs -= 1
+        if error is not None:
+            pack.job_errors.append(error)
+            pack.failed_jobs.append(job)
+        self._pack_updated(pack_id)
+
+    def _remap_gid(self, gid: str, new_gid: str):
+        """Follow a task that was restarted under a new gid"""
+        self.task_list.rename(gid, new_gid)
+        if gid in self.gid_task:
+            self.gid_task[new_gid] = self.gid_task.pop(gid)
+        pack_id = self.gid_pack.pop(gid, None)
+        if pack_id in self.packs:
+            pack = self.packs[pack_id]
+            self.gid_pack[new_gid] = pack_id
+            pack.gids.discard(gid)
+            pack.gids.add(new_gid)
+            pack.failed.discard(gid)
+
+    @staticmethod
+    def _index_file(hash_index: Optional[HashIndex], task: DownloadOptions):
+        if hash_index is None or not task.checksum:
+            return
+        try:
+            hash_index.record(task.path, task.checksum)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.warning(f"Failed to index {task.path}: {e}")
+
+    def _fetch_cached(self, task: DownloadOptions) -> bool:
+        if self.mod_cache is None or not task.checksum:
+            return False
+        try:
+            return self.mod_cache.fetch(task.checksum, task.path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to fetch {task.out} from mod cache: {e}")
+            return False
+
+    def _store_cached(self, gid: str):
+        task = self.gid_task.pop(gid, None)
+        if self.mod_cache is None or task is None or not task.checksum:
+            return
+        try:
+            self.mod_cache.store(task.checksum, task.path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to add {task.out} to mod cache: {e}")
 
-    @pyqtSlot(str)
     def download_error(self, gid: str):
-        g = self.client.tell_status(gid)
-        uri = g["files"][0]["uris"][0]["uri"]
-        if uri not in self.retry_counter:
-            self.retry_counter[uri] = 1
-        else:
-            self.retry_counter[uri] += 1
-        logger.error(f"{uri} download failed. ({self.retry_counter[uri]}/5 attempts)")
-        if self.retry_counter[uri] < 5:
-            QTimer.singleShot(self.RETRY_INTERVAL, functools.partial(self.client.restart_download, gid))
+        self.task_list.update(gid, status="error", downloadSpeed=0)
+        self._fetch_error_message(gid)
+        self._release_retry(gid)
+        task = self.gid_task.get(gid)
+        if task is None:
+            return
+
+        url = self.retry_urls.get(task.path, task.url)
+        attempt = self.retry_counter[task.path] = self.retry_counter.get(task.path, 0) + 1
+        retry = self.retry_scheduler.failed(url, attempt, task.url)
+        if retry is not None:
+            delay, next_url = retry
+            logger.error(f"{url} download failed ({attempt}/{self.retry_scheduler.max_attempts} attempts), "
+                         f"retrying in {delay:.1f}s")
+            self.call_later(delay, self._restart, gid, next_url)
+            return
+
+        logger.error(f"{url} download failed ({attempt}/{self.retry_scheduler.max_attempts} attempts), giving up")
+        self._give_up(gid)
+
+    def _give_up(self, gid: str):
+        self.mod_failed.emit(gid)
+        pack_id = self.gid_pack.get(gid)
+        if pack_id in self.packs:
+            self.packs[pack_id].failed.add(gid)
+            self._pack_updated(pack_id)
+        self._schedule_feed()
+
+    def _fetch_error_message(self, gid: str):
+        """Show the error message of a failed task without blocking on the rpc call"""
+        try:
+            future = self.event_listener.submit(lambda rpc: rpc.tell_status(gid, ["gid", "errorMessage"]), timeout=0)
+        except ConnectionError:
+            return
+        future.add_done_callback(
+            lambda f: f.exception() is None and self.post(self.task_list.update_all, [f.result()]))
+
+    def _restart(self, gid: str, url: str):
+        if gid not in self.gid_task:
+            # restarted by retry_all in the meantime
+            return
+        if not self.retry_scheduler.acquire(url, (gid, url)):
+            logger.info(f"Too many retries running against {url}, waiting for a slot")
+            return
+        self._restart_now(gid, url)
+
+    def _restart_now(self, gid: str, url: str):
+        """Restart a failed task from url, the retry slot of its host is already taken"""
+        if gid not in self.gid_task:
+            self._next_retry(url)
+            return
+        try:
+            new_gid = self.client.restart_downloads({gid: url}).get(gid)
+        except (OSError, RPCException) as e:
+            logger.error(f"Failed to restart {gid}: {e}")
+            new_gid = None
+        if new_gid is None:
+            self._next_retry(url)
+            self._give_up(gid)
+            return
+
+        self.retry_urls[self.gid_task[gid].path] = url
+        self._remap_gid(gid, new_gid)
+        self.retrying[new_gid] = url
+
+    def _release_retry(self, gid: str, succeeded: bool = False):
+        url = self.retrying.pop(gid, None)
+        if url is None:
+            return
+        if succeeded:
+            self.retry_scheduler.succeeded(url)
+        self._next_retry(url)
+
+    def _next_retry(self, url: str):
+        """Hand the retry slot of the host of url to the next waiting task"""
+        waiting = self.retry_scheduler.release(url)
+        if waiting is not None:
+            self.post(self._restart_now, *waiting)
 
-    @pyqtSlot()
     def retry_all(self):
         if not self.downloading:
             return
-        self.client.retry_all()
+        self._retry_jobs()
+        self._retry_rejected()
+        restarted = self._restart_failed()
+        if restarted is None:
+            return
+        for gid, new_gid in restarted.items():
+            self._remap_gid(gid, new_gid)
         self.retry_counter = {}
+        self.retrying = {}
+        self.retry_scheduler.reset()
+
+    def _retry_jobs(self):
+        """Run the failed jobs of every pack again, otherwise a pack with a failed job could never complete"""
+        for pack_id, pack in self.packs.items():
+            if pack.failed_jobs:
+                jobs, pack.failed_jobs, pack.job_errors = pack.failed_jobs, [], []
+                logger.info(f"Retrying {len(jobs)} failed jobs of {pack.name}")
+                self._submit_jobs(pack_id, jobs)
+
+    def _retry_rejected(self):
+        for pack_id, pack in self.packs.items():
+            self.backlog.extend((pack_id, task) for task in pack.rejected)
+            pack.rejected = []
+        self._schedule_feed()
+
+    def _restart_failed(self) -> Optional[dict[str, str]]:
+        """Restart every failed task, @return: old gid -> new gid mapping, None if the restart failed"""
+        # pipelined on the listener's websocket, the restart requests of all tasks are in flight at the same time.
+        # Waiting for the result keeps notifications about the new gids queued until they are mapped
+        gids = set(self.gid_task) if self.shared else None
+        try:
+            future = self.event_listener.submit(lambda rpc: rpc.retry_all(gids))
+        except ConnectionError as e:
+            logger.warning(f"{e}, retrying over http")
+            restarted = self.client.retry_all(gids)
+        else:
+            try:
+                restarted = future.result(self.RPC_TIMEOUT)
+            except (ConnectionError, TimeoutError, RPCException) as e:
+                logger.error(f"Failed to restart failed tasks: {e}")
+                return None
+        return restarted
+
+    def _task_event(self, status: str, gid: str):
+        if status == "active":
+            self.task_list.update(gid, status=status)
+        else:
+            self.task_list.update(gid, status=status, downloadSpeed=0)
 
-    @pyqtSlot(str)
     def mod_complete(self, gid: str):
+        task = self.gid_task.get(gid)
+        try:
+            size = os.path.getsize(task.path) if task is not None else 0
+        except OSError:
+            size = 0
+        self.task_list.update(gid, status="complete", downloadSpeed=0, totalLength=size, completedLength=size)
+        if task is not None and gid not in self.retrying:
+            self.retry_scheduler.succeeded(self.retry_urls.get(task.path, task.url))
+        self._release_retry(gid, succeeded=True)
+        self._store_cached(gid)
+        pack_id = self.gid_pack.pop(gid, None)
+        if pack_id not in self.packs:
+            return
+
+        pack = self.packs[pack_id]
+        if task is not None:
+            # aria2 verified the checksum
+            self._index_file(pack.hash_index, task)
+        pack.gids.discard(gid)
+        pack.completed += 1
         self.completed_mods += 1
-        logger.info(gid + f" completed {self.completed_mods}/{self.total_mods}")
-        self.progress_changed.emit(self.completed_mods, self.total_mods)
+        logger.info(gid + f" completed {pack.completed}/{pack.total} ({pack.name})")
+        self._pack_updated(pack_id)
+        self._schedule_feed()
 
-        if self.completed_mods == self.total_mods:
-            self.downloading = False
-            logger.info("download complete")
-            self.download_complete.emit()
-            self.refresh_data()
-            self.timer.stop()
+    def _tick(self):
+        if not self.downloading:
+            self._ticking = False
+            return
+        self.refresh_data()
+        self.call_later(self.UPDATE_INTERVAL, self._tick)
 
-    @pyqtSlot()
     def refresh_data(self):
-        self.task_list = self._ta.validate_python(self.client.get_all_downloads())
-        self.task_updated.emit()
+        """Poll the progress of active tasks, other state changes arrive as notifications"""
+        self.task_list.update_all(self.client.tell_active(self.ACTIVE_KEYS))
+        self._emit_changes()
+
+    def resync(self):
+        """Reconcile task_list with a snapshot of the whole aria2 queue, in case a notification was missed"""
+        self.task_list.update_all(self.client.get_all_downloads(self.ACTIVE_KEYS + ["errorMessage"]))
+        self._emit_changes()
+
+    def _emit_changes(self):
+        changed = self.task_list.take_changes()
+        if changed:
+            self.task_updated.emit(changed)
+
+    def _remove_tasks(self, gids: list[str]):
+        """Stop unfinished tasks in a shared aria2, which keeps running after this manager"""
+        if not gids:
+            return
+        multicall = MulticallClient(self.client)
+        for gid in gids:
+            multicall.remove(gid)
+        try:
+            multicall.multicall(raise_errors=False)
+        except OSError as e:
+            logger.warning(f"Failed to remove unfinished tasks: {e}")
 
-    @pyqtSlot()
     def shutdown(self):
-        self.timer.stop()
-        self.client.shutdown()
+        """Stop run() and aria2, unless aria2 is shared"""
+        self._running = False
+        if self.shared:
+            self._remove_tasks([gid for pack in self.packs.values() for gid in pack.gids])
+        for pack in self.packs.values():
+            if pack.hash_index is not None:
+                pack.hash_index.close()
+        self.packs = {}
+        self.backlog.clear()
+        self._job_pool.shutdown(wait=False, cancel_futures=True)
+        if not self.shared:
+            self.client.shutdown()
@@ -0,0 +1,43 @@
+import math
+import os
+from typing import TYPE_CHECKING
+
+from .constants import DOWNLOAD_LARGE_FILE, DOWNLOAD_MAX_SPLIT, DOWNLOAD_SPLIT_SIZE
+
+__all__ = ["OPTIONAL_DIRS", "prioritize"]
+
+if TYPE_CHECKING:
+    from .download_manager import DownloadOptions
+
+# files the game starts without, queued after mods and configs of the same size class
+OPTIONAL_DIRS = {"resourcepacks", "shaderpacks"}
+
+
+def _connections(size: int) -> int:
+    return max(1, min(DOWNLOAD_MAX_SPLIT, math.ceil(size / DOWNLOAD_SPLIT_SIZE)))
+
+
+def _rank(task: "DownloadOptions") -> tuple:
+    if task.size >= DOWNLOAD_LARGE_FILE:
+        # largest first, they take the longest even when split
+        return 0, 0, -task.size
+    optional = os.path.basename(os.path.normpath(task.dir)) in OPTIONAL_DIRS
+    # unknown sizes go last
+    return 1, optional, task.size or math.inf
+
+
+def prioritize(tasks: list["DownloadOptions"]) -> list["DownloadOptions"]:
+    """
+    Order files for aria2 and choose the number of connections of each one from its size.
+    Very large files (usually resource and shader packs) come first and are split across many connections, so they
+    don't start late and hold up the end of the download. The rest follows smallest first, mods and configs before
+    optional packs, so most files of the pack land early. Files of unknown size keep the aria2 defaults
+    @return: reordered copies of the tasks
+    """
+    ordered = []
+    for task in sorted(tasks, key=_rank):
+        if task.size > 0 and task.split is None:
+            connections = _connections(task.size)
+            task = task.model_copy(update={"split": connections, "max_connection_per_server": connections})
+        ordered.append(task)
+    return ordered
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+
+from .constants import SESSION_DIR
+from .download_manager import DownloadOptions
+from .instance_record import InstanceRecord, UpdatePlan
+from .modpack_manifest import ModpackManifest
+
+__all__ = ["DownloadSession"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+class DownloadSession(BaseModel):
+    """
+    Journal of an unfinished modpack download, so that it can be resumed after the program closed or crashed.
+    The resolved modpack and update plan are written once when the download starts and removed once the modpack is
+    installed. Which files finished is not journaled: on resume the download manager checks the files against the hash
+    index, which aria2's verified downloads are recorded in, so finished files cost a stat instead of a rehash.
+    """
+    manifest: ModpackManifest
+    downloads: list[DownloadOptions]
+    # install record before the update, needed to keep treating user modified files as modified
+    record: Optional[InstanceRecord] = None
+    kept: list[str] = []
+
+    _directory: str = SESSION_DIR
+
+    @staticmethod
+    def _base_path(directory: str, minecraft_dir: str) -> str:
+        key = hashlib.sha1(os.path.abspath(minecraft_dir).encode()).hexdigest()
+        return os.path.join(directory, key)
+
+    @property
+    def base_path(self) -> str:
+        return self._base_path(self._directory, self.manifest.minecraft_dir)
+
+    @property
+    def plan(self) -> UpdatePlan:
+        return UpdatePlan(record=self.record, downloads=self.downloads, kept=self.kept)
+
+    @classmethod
+    def start(cls, manifest: ModpackManifest, plan: UpdatePlan, directory: str = SESSION_DIR) -> "DownloadSession":
+        """Write the journal of a download that is about to start, replacing an older one of the same minecraft dir"""
+        session = cls(manifest=manifest, downloads=plan.downloads, record=plan.record, kept=plan.kept)
+        session._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        path = session.base_path
+        with open(path + ".json.tmp", "w") as f:
+            f.write(session.model_dump_json())
+        os.replace(path + ".json.tmp", path + ".json")
+        return session
+
+    @classmethod
+    def load_all(cls, directory: str = SESSION_DIR) -> list["DownloadSession"]:
+        """Journals of downloads that did not finish"""
+        sessions = []
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return sessions
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path) as f:
+                    session = cls.model_validate_json(f.read())
+            except (OSError, ValidationError) as e:
+                logger.warning(f"Ignoring unreadable download session {path}: {e}")
+                continue
+            session._directory = directory
+            sessions.append(session)
+        return sessions
+
+    def remove(self):
+        """Delete the journal once the download finished"""
+        try:
+            os.remove(self.base_path + ".json")
+        except FileNotFoundError:
+            pass
+
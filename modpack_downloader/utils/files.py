@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import sys
+import zipfile
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+# ioctl request number of FICLONE on linux, used to make copy-on-write clones (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def parse_checksum(checksum: str) -> tuple[str, str]:
+    """Split an aria2 style checksum (e.g. sha-1=0123abcd) into algorithm and lowercase hex digest"""
+
+    algo, _, value = checksum.partition("=")
+    if not algo or not value:
+        raise ValueError(f"invalid checksum: {checksum}")
+    return algo.lower(), value.lower()
+
+
+def hash_file(path: str, algo: str, buffer_size: int = 1 << 20) -> str:
+    """
+    Calculate the hex digest of a file, algo can be either hashlib or aria2 style (sha-1).
+    Files larger than buffer_size are memory mapped and hashed in one call, which releases the GIL for the whole file
+    """
+
+    h = hashlib.new(algo.replace("-", ""))
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > buffer_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _reflink(src: str, dst: str):
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Place src at dst without duplicating data if possible.
+    Tries a hardlink first, then a reflink, and falls back to a plain copy.
+    An existing dst is replaced.
+    """
+
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+
+    tmp = dst + ".tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        try:
+            if not sys.platform.startswith("linux"):
+                raise OSError("reflink is not supported on this platform")
+            _reflink(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def safe_rel_path(path: str) -> bool:
+    """Whether a relative path from a modpack stays inside the directory it is relative to"""
+    path = os.path.normpath(path)
+    return not (path.startswith("..") or os.path.isabs(path) or os.path.splitdrive(path)[0])
+
+
+def archive_entries(archive: zipfile.ZipFile, *folders: str) -> dict[str, zipfile.ZipInfo]:
+    """
+    List the files inside folders of a zip archive, merged in order (a file of a later folder replaces the same file
+    of an earlier one)
+    @return: path relative to its folder -> zip entry
+    """
+    entries = {}
+    for folder in folders:
+        prefix = folder.strip("/") + "/"
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.startswith(prefix):
+                continue
+            rel_path = os.path.normpath(info.filename[len(prefix):])
+            if not safe_rel_path(rel_path):
+                logger.warning(f"Skipping suspicious archive entry {info.filename}")
+                continue
+            entries[rel_path] = info
+    return entries
@@ -1,20 +1,14 @@
-import abc
 from abc import abstractmethod, ABC
 
-import PyQt6.sip
-from PyQt6.QtCore import QObject, pyqtSignal
+from .signals import Signal
 
 
-class AbstractQObjectMeta(PyQt6.sip.wrappertype, abc.ABCMeta):
-    pass
+class ForegroundTask(ABC):
+    complete = Signal(object)
+    progress_changed = Signal(int, int)
+    failed = Signal(str)
 
-
-class ForegroundTask(QObject, ABC, metaclass=AbstractQObjectMeta):
-    complete = pyqtSignal(object)
-    progress_changed = pyqtSignal(int, int)
-    failed = pyqtSignal(str)
-
-    status = pyqtSignal(str)
+    status = Signal(str)
 
     @abstractmethod
     def run(self): ...
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from .files import hash_file, parse_checksum
+
+__all__ = ["HASH_INDEX_FILE", "HashIndex", "open_hash_index"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+HASH_INDEX_FILE = os.path.join(".modpack_downloader", "hashes.sqlite")
+
+
+class HashIndex:
+    """
+    Digests of the files of a minecraft dir, shared between threads.
+    Entries are keyed by path and trusted as long as size, mtime and inode of the file are unchanged, so checking an
+    unchanged file costs a stat instead of reading it.
+    """
+
+    def __init__(self, minecraft_dir: str):
+        self.root = os.path.abspath(minecraft_dir)
+        path = os.path.join(self.root, HASH_INDEX_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # every indexed file is committed on its own; the index is only a cache, so those commits don't need to wait
+        # for the disk, a crash loses at most the last entries
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files "
+                         "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                         "inode INTEGER NOT NULL, digests TEXT NOT NULL)")
+        self._db.commit()
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def _lookup(self, key: str, st: os.stat_result) -> Optional[dict[str, str]]:
+        """Digests of an unchanged file, None if the file changed or is unknown"""
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, inode, digests FROM files WHERE path = ?",
+                                   (key,)).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return json.loads(row[3])
+
+    def _store(self, key: str, st: os.stat_result, digests: dict[str, str]):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                             (key, st.st_size, st.st_mtime_ns, st.st_ino, json.dumps(digests)))
+            self._db.commit()
+
+    def hash(self, path: str, algo: str) -> str:
+        """
+        Hex digest of a file, computed only if the file changed since it was last indexed
+        @param algo: hashlib or aria2 style algorithm name
+        """
+        algo = algo.replace("-", "").lower()
+        key = self._key(path)
+        st = os.stat(path)
+        digests = self._lookup(key, st) or {}
+        if algo in digests:
+            return digests[algo]
+
+        digests[algo] = hash_file(path, algo)
+        # the file may have been replaced while it was read
+        if os.stat(path).st_mtime_ns == st.st_mtime_ns:
+            self._store(key, st, digests)
+        return digests[algo]
+
+    def cached(self, path: str, algo: str) -> Optional[str]:
+        """Hex digest of a file if it is indexed and unchanged since, None otherwise. Never reads the file"""
+        return (self._lookup(self._key(path), os.stat(path)) or {}).get(algo.replace("-", "").lower())
+
+    def record(self, path: str, *checksums: str):
+        """Index a file known to match aria2 style checksums, e.g. one aria2 just downloaded and verified"""
+        digests = {}
+        for checksum in checksums:
+            algo, value = parse_checksum(checksum)
+            digests[algo.replace("-", "")] = value
+        key = self._key(path)
+        st = os.stat(path)
+        self._store(key, st, digests)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_hash_index(minecraft_dir: str) -> Optional[HashIndex]:
+    """Open the hash index of a minecraft dir, None if it cannot be opened (files are hashed every time then)"""
+    try:
+        return HashIndex(minecraft_dir)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Failed to open hash index of {minecraft_dir}: {e}")
+        return None
@@ -0,0 +1,27 @@
+from dataclasses import dataclass
+from enum import IntEnum
+
+
+class ModpackType(IntEnum):
+    CF_LOCAL = 0
+    CF_ONLINE = 1
+    FTB = 2
+    MODRINTH = 3
+
+
+@dataclass
+class InputOptions:
+    modpack_type: ModpackType
+    save_dir: str
+    local_modpack_file: str = ""
+    # curseforge project id or slug of an online pack, the file id is version_id (0 for the latest file)
+    project: str = ""
+    # modrinth version id of an online pack (project is the modrinth project), empty for the latest version
+    version: str = ""
+    modpack_id: int = 0
+    version_id: int = 0
+    multimc: bool = False
+    # instances folder of MultiMC or Prism Launcher to install the modpack into once downloaded
+    launcher_dir: str = ""
+    # treat save_dir as the minecraft dir of an installed instance and only download what changed
+    update_instance: bool = False
@@ -0,0 +1,188 @@
+import logging
+import os
+import sqlite3
+import threading
+import zipfile
+from dataclasses import dataclass, field
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+
+from .download_manager import DownloadOptions
+from .files import archive_entries, hash_file, parse_checksum
+from .foreground_task import ForegroundTask
+from .hash_index import HashIndex, open_hash_index
+from .modpack_manifest import ModpackManifest
+
+__all__ = ["RECORD_FILE", "InstalledFile", "InstanceRecord", "UpdatePlan", "UpdatePlanner", "plan_update"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+RECORD_FILE = os.path.join(".modpack_downloader", "installed.json")
+
+# Files in these folders are always replaced on update, anything else (configs, scripts...) is kept if the user
+# modified it
+MANAGED_DIRS = ("mods", "resourcepacks", "shaderpacks")
+
+
+class InstalledFile(BaseModel):
+    size: int
+    checksum: str
+
+
+class InstanceRecord(BaseModel):
+    """Files installed into a minecraft dir, keyed by their path relative to it"""
+    name: str
+    version: str
+    files: dict[str, InstalledFile] = {}
+
+    @classmethod
+    def load(cls, minecraft_dir: str) -> Optional["InstanceRecord"]:
+        try:
+            with open(os.path.join(minecraft_dir, RECORD_FILE)) as f:
+                return cls.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValidationError) as e:
+            logger.warning(f"Ignoring unreadable install record in {minecraft_dir}: {e}")
+            return None
+
+    def save(self, minecraft_dir: str):
+        path = os.path.join(minecraft_dir, RECORD_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            f.write(self.model_dump_json())
+        os.replace(path + ".tmp", path)
+
+    def is_user_modified(self, minecraft_dir: str, rel_path: str, index: Optional[HashIndex] = None) -> bool:
+        """Whether an installed file that the user may edit differs from what was installed"""
+        entry = self.files.get(rel_path)
+        if entry is None or is_managed(rel_path):
+            return False
+        path = os.path.join(minecraft_dir, rel_path)
+        try:
+            if os.path.getsize(path) != entry.size:
+                return True
+            algo, value = parse_checksum(entry.checksum)
+            return (index.hash(path, algo) if index is not None else hash_file(path, algo)) != value
+        except FileNotFoundError:
+            return False
+
+    @classmethod
+    def from_manifest(cls, manifest: ModpackManifest, plan: Optional["UpdatePlan"] = None) -> "InstanceRecord":
+        files = {}
+        for task in manifest.modlist:
+            rel_path = _rel_path(manifest, task)
+            if not os.path.isfile(task.path):
+                continue
+            checksum = task.checksum or f"sha-1={hash_file(task.path, 'sha-1')}"
+            files[rel_path] = InstalledFile(size=os.path.getsize(task.path), checksum=checksum)
+
+        for rel_path, checksum in manifest.overrides.items():
+            path = os.path.join(manifest.minecraft_dir, rel_path)
+            if os.path.isfile(path):
+                files[rel_path] = InstalledFile(size=os.path.getsize(path), checksum=checksum)
+
+        # keep the originally installed checksum of files the user changed, so they are still treated as modified
+        if plan is not None and plan.record is not None:
+            for rel_path in plan.kept:
+                if rel_path in plan.record.files:
+                    files[rel_path] = plan.record.files[rel_path]
+
+        return cls(name=manifest.name, version=manifest.version, files=files)
+
+
+@dataclass
+class UpdatePlan:
+    record: Optional[InstanceRecord]
+    downloads: list[DownloadOptions]
+    removed: list[str] = field(default_factory=list)
+    kept: list[str] = field(default_factory=list)
+
+    def apply(self, minecraft_dir: str):
+        """Delete files that are no longer part of the modpack"""
+        for rel_path in self.removed:
+            try:
+                os.remove(os.path.join(minecraft_dir, rel_path))
+                logger.info(f"Removed {rel_path}")
+            except FileNotFoundError:
+                pass
+
+
+def is_managed(rel_path: str) -> bool:
+    return rel_path.replace("\\", "/").split("/", 1)[0] in MANAGED_DIRS
+
+
+def _rel_path(manifest: ModpackManifest, task: DownloadOptions) -> str:
+    return os.path.relpath(os.path.abspath(task.path), os.path.abspath(manifest.minecraft_dir))
+
+
+def plan_update(manifest: ModpackManifest, index: Optional[HashIndex] = None) -> UpdatePlan:
+    """
+    Compare a resolved modpack with what is already installed in its minecraft dir
+    @param index: hash index of the minecraft dir, avoids reading files that did not change
+    @return: files to download and files to delete. Everything is downloaded if nothing is installed
+    """
+    minecraft_dir = manifest.minecraft_dir
+    record = InstanceRecord.load(minecraft_dir)
+    if record is None:
+        return UpdatePlan(record=None, downloads=list(manifest.modlist))
+
+    logger.info(f"Updating {record.name} {record.version} to {manifest.version}")
+    plan = UpdatePlan(record=record, downloads=[])
+    wanted = set(manifest.overrides)
+    if manifest.archive:
+        with manifest.open_archive() as archive:
+            wanted.update(archive_entries(archive, *manifest.override_dirs))
+    for task in manifest.modlist:
+        rel_path = _rel_path(manifest, task)
+        wanted.add(rel_path)
+        entry = record.files.get(rel_path)
+        if entry is None:
+            plan.downloads.append(task)
+        elif (task.checksum and entry.checksum == task.checksum and os.path.isfile(task.path)
+              and os.path.getsize(task.path) == entry.size):
+            continue
+        elif record.is_user_modified(minecraft_dir, rel_path, index):
+            plan.kept.append(rel_path)
+        else:
+            plan.downloads.append(task)
+
+    for rel_path in record.files:
+        if rel_path in wanted:
+            continue
+        if record.is_user_modified(minecraft_dir, rel_path, index):
+            plan.kept.append(rel_path)
+        else:
+            plan.removed.append(rel_path)
+
+    logger.info(f"{len(plan.downloads)} files to download, {len(plan.removed)} to remove, "
+                f"{len(plan.kept)} modified by user")
+    return plan
+
+
+class UpdatePlanner(ForegroundTask):
+    """
+    Work out which files of a resolved modpack have to be downloaded and delete the ones it no longer has.
+    Reads the archive and may hash every file the user could have modified, so it runs off the GUI thread.
+    Completes with the applied UpdatePlan and the hash index of the minecraft dir (None if it could not be opened)
+    """
+
+    def __init__(self, modpack_info: ModpackManifest):
+        self.modpack_info = modpack_info
+
+    def run(self):
+        threading.current_thread().name = "UpdatePlannerThread"
+        minecraft_dir = self.modpack_info.minecraft_dir
+        self.status.emit("Checking installed files")
+        hash_index = open_hash_index(minecraft_dir)
+        try:
+            plan = plan_update(self.modpack_info, hash_index)
+            plan.apply(minecraft_dir)
+        except (OSError, sqlite3.Error, zipfile.BadZipFile) as e:
+            logger.error("Failed to check installed files", exc_info=e)
+            if hash_index is not None:
+                hash_index.close()
+            self.failed.emit(f"Failed to check installed files: {e}")
+            return
+        self.complete.emit((plan, hash_index))
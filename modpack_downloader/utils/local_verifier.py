@@ -0,0 +1,60 @@
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from .files import hash_file, parse_checksum
+from .hash_index import HashIndex
+
+__all__ = ["verify_file", "find_missing"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+if TYPE_CHECKING:
+    from .download_manager import DownloadOptions
+
+
+def verify_file(task: "DownloadOptions", index: Optional[HashIndex] = None) -> bool:
+    """
+    Whether the file of a task is already on disk, matching its checksum if it has one
+    @param index: hash index of the minecraft dir, unchanged files are not read again
+    """
+    try:
+        if not task.checksum:
+            return os.path.getsize(task.path) > 0
+        algo, value = parse_checksum(task.checksum)
+        digest = index.hash(task.path, algo) if index is not None else hash_file(task.path, algo)
+        return digest == value
+    except (OSError, ValueError):
+        return False
+
+
+def find_missing(tasks: Iterable["DownloadOptions"], workers: Optional[int] = None,
+                 index: Optional[HashIndex] = None) -> list["DownloadOptions"]:
+    """
+    Check the files already present in parallel, partial downloads (with an .aria2 control file) are left to aria2.
+    Files that don't match their checksum are deleted, aria2 would otherwise keep them because of conditional-get
+    @param tasks: files of a modpack
+    @param workers: number of hashing threads, hashlib releases the GIL so threads run in parallel
+    @param index: hash index of the minecraft dir
+    @return: tasks that still have to be downloaded
+    """
+    tasks = list(tasks)
+    present = [task for task in tasks if os.path.isfile(task.path) and not os.path.exists(task.path + ".aria2")]
+    if not present:
+        return tasks
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="VerifyThread") as pool:
+        results = pool.map(functools.partial(verify_file, index=index), present)
+        valid = {task.path for task, ok in zip(present, results) if ok}
+
+    for task in present:
+        if task.path not in valid:
+            logger.info(f"{task.path} doesn't match its checksum, downloading it again")
+            try:
+                os.remove(task.path)
+            except FileNotFoundError:
+                pass
+    logger.info(f"{len(valid)}/{len(tasks)} files are already present")
+    return [task for task in tasks if task.path not in valid]
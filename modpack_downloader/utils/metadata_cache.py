@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from .constants import METADATA_CACHE_FILE
+
+__all__ = ["MetadataCache"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+class MetadataCache:
+    """
+    On-disk cache of api responses, shared between threads.
+    Objects (e.g. curseforge files and mods) are keyed by kind and id, whole GET responses are keyed by url and
+    revalidated with their ETag.
+    """
+
+    def __init__(self, path: str = METADATA_CACHE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS objects "
+                         "(kind TEXT NOT NULL, id INTEGER NOT NULL, data TEXT NOT NULL, fetched_at REAL NOT NULL, "
+                         "PRIMARY KEY (kind, id))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(url TEXT PRIMARY KEY, etag TEXT, data TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self._db.commit()
+
+    def get_objects(self, kind: str, ids: Iterable[int], ttl: Optional[float] = None) -> dict[int, dict]:
+        """
+        @param kind: object kind, e.g. cf_file
+        @param ids: object ids
+        @param ttl: ignore entries older than ttl seconds, None to return entries of any age
+        @return: id -> object of every cached id
+        """
+        ids = list(set(ids))
+        min_time = time.time() - ttl if ttl is not None else 0
+        result = {}
+        with self._lock:
+            # stay below sqlite's limit of host parameters
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = self._db.execute(f"SELECT id, data FROM objects WHERE kind = ? AND fetched_at >= ? "
+                                        f"AND id IN ({','.join('?' * len(chunk))})", [kind, min_time, *chunk])
+                result.update((object_id, json.loads(data)) for object_id, data in rows)
+        return result
+
+    def put_objects(self, kind: str, objects: dict[int, dict]):
+        now = time.time()
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                                 [(kind, object_id, json.dumps(data), now) for object_id, data in objects.items()])
+            self._db.commit()
+
+    def get_response(self, url: str, ttl: Optional[float] = None) -> Optional[tuple[Optional[str], dict]]:
+        """
+        @param ttl: ignore a response older than ttl seconds, None to return it whatever its age
+        @return: (etag, json body) of a cached response
+        """
+        min_time = time.time() - ttl if ttl is not None else 0
+        with self._lock:
+            row = self._db.execute("SELECT etag, data FROM responses WHERE url = ? AND fetched_at >= ?",
+                                   (url, min_time)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put_response(self, url: str, etag: Optional[str], data: dict):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                             (url, etag, json.dumps(data), time.time()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
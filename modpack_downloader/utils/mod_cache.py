@@ -0,0 +1,138 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .constants import MOD_CACHE_DIR, MOD_CACHE_MAX_SIZE
+from .files import hash_file, link_or_copy, parse_checksum
+
+__all__ = ["ModCache"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+class ModCache:
+    """
+    Content-addressed store of downloaded files shared between modpacks.
+    Files are keyed by their checksum (e.g. sha-1=0123abcd) and evicted in LRU order once the cache exceeds max_size.
+    Cached files are hardlinked into instances, so an entry whose size, mtime or inode changed since it was stored
+    (e.g. written to through an instance) is hashed again before it is reused.
+    """
+
+    def __init__(self, root: str = MOD_CACHE_DIR, max_size: int = MOD_CACHE_MAX_SIZE):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(checksum TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL, "
+                         "mtime_ns INTEGER, inode INTEGER)")
+        # caches created before the stat columns existed, their entries are verified on the next fetch
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        for column in ("mtime_ns", "inode"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE entries ADD COLUMN {column} INTEGER")
+        self._db.commit()
+
+    def _path(self, checksum: str) -> str:
+        algo, value = parse_checksum(checksum)
+        return os.path.join(self.root, algo, value[:2], value)
+
+    def _forget(self, checksum: str):
+        self._db.execute("DELETE FROM entries WHERE checksum = ?", (checksum,))
+        self._db.commit()
+
+    def _verify(self, checksum: str, path: str, row: tuple) -> bool:
+        """Whether the cached file still matches checksum, hashing it only if its stat changed since it was stored"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if st.st_size != row[0]:
+            return False
+        if (st.st_mtime_ns, st.st_ino) == tuple(row[1:]):
+            return True
+        algo, value = parse_checksum(checksum)
+        if hash_file(path, algo) != value:
+            return False
+        with self._lock:
+            self._db.execute("UPDATE entries SET mtime_ns = ?, inode = ? WHERE checksum = ?",
+                             (st.st_mtime_ns, st.st_ino, checksum))
+            self._db.commit()
+        return True
+
+    def fetch(self, checksum: str, dest: str) -> bool:
+        """
+        Place the cached file matching checksum at dest
+        @param checksum: aria2 style checksum
+        @param dest: destination path
+        @return: True on a cache hit
+        """
+        path = self._path(checksum)
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, inode FROM entries WHERE checksum = ?",
+                                   (checksum,)).fetchone()
+        if row is None:
+            return False
+        if not self._verify(checksum, path, row):
+            logger.warning("Cache entry %s is missing or damaged, dropping it", checksum)
+            with self._lock:
+                self._forget(checksum)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return False
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_used = ? WHERE checksum = ?", (time.time(), checksum))
+            self._db.commit()
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        link_or_copy(path, dest)
+        return True
+
+    def store(self, checksum: str, src: str):
+        """
+        Add a verified file to the cache
+        @param checksum: aria2 style checksum of src
+        @param src: path of the file
+        """
+        size = os.path.getsize(src)
+        if size > self.max_size:
+            return
+
+        path = self._path(checksum)
+        with self._lock:
+            row = self._db.execute("SELECT size FROM entries WHERE checksum = ?", (checksum,)).fetchone()
+            if row is not None and os.path.isfile(path):
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            link_or_copy(src, path)
+            st = os.stat(path)
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                             (checksum, size, time.time(), st.st_mtime_ns, st.st_ino))
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        for checksum, size in self._db.execute("SELECT checksum, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(self._path(checksum))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE checksum = ?", (checksum,))
+            total -= size
+        self._db.commit()
+        logger.info("Mod cache trimmed to %d bytes", total)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,18 +1,267 @@
+import json
+import logging
+import os
+import re
+import shutil
 import threading
+import zipfile
+from typing import Iterator, Optional
 
-from PyQt6.QtCore import pyqtSlot
+from pydantic import BaseModel, ValidationError
 
-from modpack_downloader.utils.foreground_task import ForegroundTask
-from modpack_downloader.utils.modpack_manifest import ModpackManifest
+from .files import link_or_copy, safe_rel_path
+from .foreground_task import ForegroundTask
+from .instance_record import RECORD_FILE
+from .modpack_manifest import Modloader, ModpackManifest, modloader_uid
+
+__all__ = ["INSTALL_MANIFEST", "InstallManifest", "LauncherInstaller", "MultiMCPackExporter", "instance_cfg",
+           "mmc_pack", "instance_files"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+# files that are compressed already, deflating them again costs time and saves next to nothing
+STORED_EXTENSIONS = (".jar", ".zip", ".png", ".ogg", ".gz", ".xz")
+# folder of minecraft_dir with the downloader's own state (install record, hash index, sessions)
+STATE_DIR = os.path.dirname(RECORD_FILE)
+COPY_BUFFER_SIZE = 1 << 20
+# file in the instance folder telling which modpack was installed there
+INSTALL_MANIFEST = "modpack_downloader.json"
+
+
+def _safe_filename(name: str) -> str:
+    """name without the characters that are invalid in file names"""
+    return re.sub(r"[\\/:*?\"<>|]", "", name).strip()
+
+
+def instance_cfg(modpack: ModpackManifest) -> str:
+    """instance.cfg of a MultiMC/Prism instance"""
+    lines = ["InstanceType=OneSix", f"name={modpack.name} {modpack.version}"]
+    if modpack.icon:
+        lines.append(f"iconKey={os.path.splitext(modpack.icon)[0]}")
+    return "\n".join(lines) + "\n"
+
+
+def mmc_pack(modpack: ModpackManifest) -> dict:
+    """mmc-pack.json of a MultiMC/Prism instance: minecraft and the modloader"""
+    components = [{"uid": "net.minecraft", "version": modpack.minecraft_version, "important": True}]
+    # fabric and quilt run on top of the intermediary mappings of the minecraft version
+    if modpack.modloader in (Modloader.FABRIC, Modloader.QUILT):
+        components.append({"uid": "net.fabricmc.intermediary", "version": modpack.minecraft_version,
+                           "dependencyOnly": True})
+    components.append({"uid": modloader_uid[modpack.modloader], "version": modpack.modloader_version})
+    return {"components": components, "formatVersion": 1}
+
+
+def instance_files(modpack: ModpackManifest) -> Iterator[tuple[str, str]]:
+    """
+    Files of the minecraft dir that belong to the instance, the downloader's own state and the icon are left out
+    @return: (absolute path, path relative to minecraft_dir) pairs
+    """
+    root = modpack.minecraft_dir
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        if rel_dir == ".":
+            dirnames[:] = [d for d in dirnames if d != STATE_DIR]
+        for filename in filenames:
+            rel_path = os.path.normpath(os.path.join(rel_dir, filename))
+            if rel_path == modpack.icon:
+                continue
+            yield os.path.join(dirpath, filename), rel_path
 
 
 class MultiMCPackExporter(ForegroundTask):
-    def __init__(self, modpack_info: ModpackManifest, parent=None):
-        super().__init__(parent)
-        self.setObjectName("PackExporterThread")
+    """
+    Export a downloaded modpack as a zip that MultiMC and Prism Launcher can import.
+    Files are streamed from minecraft_dir into the zip with a fixed size buffer, nothing is staged on disk, and already
+    compressed files like jars are stored instead of deflated.
+    """
+
+    def __init__(self, modpack_info: ModpackManifest, output: Optional[str] = None):
+        """
+        @param output: path of the zip, <name>-<version>.zip next to minecraft_dir by default
+        """
+        self.modpack_info = modpack_info
+        if output is None:
+            filename = _safe_filename(f"{modpack_info.name}-{modpack_info.version}") + ".zip"
+            output = os.path.join(os.path.dirname(os.path.normpath(modpack_info.minecraft_dir)), filename)
+        self.output = output
+
+    def run(self):
+        threading.current_thread().name = "PackExporterThread"
+        modpack = self.modpack_info
+        logger.info(f"Exporting {modpack.name} to {self.output}")
+        self.status.emit("Exporting MultiMC pack")
+
+        part = self.output + ".part"
+        try:
+            files = list(instance_files(modpack))
+            total = sum(os.path.getsize(path) for path, _ in files)
+            written = 0
+            with zipfile.ZipFile(part, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr("instance.cfg", instance_cfg(modpack))
+                zf.writestr("mmc-pack.json", json.dumps(mmc_pack(modpack), indent=4))
+                if modpack.icon and os.path.isfile(icon := os.path.join(modpack.minecraft_dir, modpack.icon)):
+                    self._add(zf, icon, os.path.basename(icon))
+
+                for path, rel_path in files:
+                    written += self._add(zf, path, ".minecraft/" + rel_path.replace(os.sep, "/"))
+                    # KiB, the sizes of big instances don't fit into the int of the Qt signal
+                    self.progress_changed.emit(written >> 10, total >> 10)
+            os.replace(part, self.output)
+
+        except OSError as e:
+            logger.error("Failed to export modpack", exc_info=e)
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            self.failed.emit(f"Failed to export modpack: {e}")
+            return
+
+        logger.info(f"Exported {len(files)} files of {modpack.name}")
+        self.complete.emit(self.output)
+
+    @staticmethod
+    def _add(zf: zipfile.ZipFile, path: str, arcname: str) -> int:
+        """Stream a file into the zip, return its size"""
+        info = zipfile.ZipInfo.from_file(path, arcname)
+        if arcname.lower().endswith(STORED_EXTENSIONS):
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+        with open(path, "rb") as src, zf.open(info, "w") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        return info.file_size
+
+
+class InstallManifest(BaseModel):
+    """Modpack installed into a launcher instance and its files, relative to the game dir"""
+    name: str
+    version: str
+    files: list[str] = []
+
+    @classmethod
+    def load(cls, instance_dir: str) -> Optional["InstallManifest"]:
+        try:
+            with open(os.path.join(instance_dir, INSTALL_MANIFEST)) as f:
+                return cls.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValidationError) as e:
+            logger.warning(f"Ignoring unreadable install manifest in {instance_dir}: {e}")
+            return None
+
+    def save(self, instance_dir: str):
+        path = os.path.join(instance_dir, INSTALL_MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            f.write(self.model_dump_json())
+        os.replace(path + ".tmp", path)
+
+
+class LauncherInstaller(ForegroundTask):
+    """
+    Install a downloaded modpack as an instance of MultiMC or Prism Launcher.
+    The instance is created in the instances folder of the launcher and its files are hardlinked (or reflinked) from
+    minecraft_dir, so it takes no extra disk space; files are copied only if neither works, e.g. across filesystems.
+    The instance folder is named after the modpack. Installing again over the instance of the same modpack updates it,
+    its instance.cfg (launcher settings) is kept and files installed before that are no longer part of the modpack are
+    removed; a folder of another modpack or of the user is never touched.
+    """
+
+    def __init__(self, modpack_info: ModpackManifest, instances_dir: str):
+        """
+        @param instances_dir: instances folder of the launcher
+        """
         self.modpack_info = modpack_info
+        self.instances_dir = instances_dir
+        self.instance_dir = os.path.join(instances_dir, _safe_filename(modpack_info.name))
+        self.installed: Optional[InstallManifest] = None
 
-    @pyqtSlot()
     def run(self):
-        threading.current_thread().name = self.objectName()
-        raise NotImplementedError
+        threading.current_thread().name = "LauncherInstallerThread"
+        modpack = self.modpack_info
+        logger.info(f"Installing {modpack.name} into {self.instance_dir}")
+        self.status.emit("Installing into launcher")
+
+        error = self._check_instance()
+        if error is not None:
+            logger.error(error)
+            self.failed.emit(error)
+            return
+
+        game_dir = os.path.join(self.instance_dir, ".minecraft")
+        try:
+            files = list(instance_files(modpack))
+            new_files = [rel_path for _, rel_path in files]
+            old_files = self.installed.files if self.installed is not None else []
+            os.makedirs(game_dir, exist_ok=True)
+            # claimed before anything else is written, with the files of both installs, so that an interrupted install
+            # can be run again and still cleans up after the previous one
+            manifest = InstallManifest(name=modpack.name, version=modpack.version,
+                                       files=list(dict.fromkeys(old_files + new_files)))
+            manifest.save(self.instance_dir)
+            cfg = os.path.join(self.instance_dir, "instance.cfg")
+            if not os.path.exists(cfg):
+                with open(cfg, "w") as f:
+                    f.write(instance_cfg(modpack))
+            with open(os.path.join(self.instance_dir, "mmc-pack.json"), "w") as f:
+                json.dump(mmc_pack(modpack), f, indent=4)
+            self._install_icon()
+
+            for i, (path, rel_path) in enumerate(files):
+                dst = os.path.join(game_dir, rel_path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                link_or_copy(path, dst)
+                self.progress_changed.emit(i + 1, len(files))
+
+            stale = set(old_files).difference(new_files)
+            for rel_path in stale:
+                self._remove(game_dir, rel_path)
+            manifest.files = new_files
+            manifest.save(self.instance_dir)
+
+        except OSError as e:
+            logger.error("Failed to install modpack into launcher", exc_info=e)
+            self.failed.emit(f"Failed to install modpack into launcher: {e}")
+            return
+
+        logger.info(f"Installed {len(files)} files of {modpack.name}, removed {len(stale)} old files")
+        self.complete.emit(self.instance_dir)
+
+    def _check_instance(self) -> Optional[str]:
+        """Why the modpack can't be installed into instance_dir, None if it can"""
+        if not os.path.isdir(self.instance_dir) or not os.listdir(self.instance_dir):
+            return None
+        installed = self.installed = InstallManifest.load(self.instance_dir)
+        if installed is None:
+            return f"{self.instance_dir} already exists and was not installed by the downloader"
+        if installed.name != self.modpack_info.name:
+            return f"{self.instance_dir} belongs to another modpack ({installed.name})"
+        return None
+
+    @staticmethod
+    def _remove(game_dir: str, rel_path: str):
+        """Remove a file that is no longer part of the modpack, and the folders it leaves empty"""
+        if not safe_rel_path(rel_path):
+            return
+        path = os.path.join(game_dir, rel_path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        logger.info(f"Removed {rel_path}")
+        folder = os.path.dirname(path)
+        while os.path.normpath(folder) != os.path.normpath(game_dir):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+    def _install_icon(self):
+        """Put the icon into the icons folder next to the instances folder, where the launchers look it up"""
+        modpack = self.modpack_info
+        icons_dir = os.path.join(os.path.dirname(os.path.normpath(self.instances_dir)), "icons")
+        icon = os.path.join(modpack.minecraft_dir, modpack.icon) if modpack.icon else None
+        if icon is not None and os.path.isfile(icon) and os.path.isdir(icons_dir):
+            link_or_copy(icon, os.path.join(icons_dir, modpack.icon))
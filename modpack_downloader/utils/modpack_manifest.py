@@ -1,8 +1,13 @@
+import io
+import zipfile
 from enum import StrEnum
 from typing import Optional
+from urllib.parse import urlsplit
 
-from pydantic import BaseModel
+import requests
+from pydantic import BaseModel, PrivateAttr
 
+from modpack_downloader.utils.constants import OVERWOLF_UA
 from modpack_downloader.utils.download_manager import DownloadOptions
 
 
@@ -23,6 +28,37 @@ class ModpackManifest(BaseModel):
     modloader_version: str
     minecraft_dir: str
     icon: Optional[str] = None
+    # modpack archive (path or url of a pack fetched into memory) and the folder inside it that is extracted into
+    # minecraft_dir
+    archive: Optional[str] = None
+    overrides_dir: str = "overrides"
+    # extracted over overrides_dir (modrinth client-overrides)
+    client_overrides_dir: Optional[str] = None
+    # override files extracted from the modpack archive, relative path -> checksum
+    overrides: dict[str, str] = {}
+
+    _archive_data: Optional[bytes] = PrivateAttr(None)
+
+    @property
+    def override_dirs(self) -> list[str]:
+        return [self.overrides_dir] + ([self.client_overrides_dir] if self.client_overrides_dir else [])
+
+    def keep_archive(self, data: bytes):
+        """Keep the content of an archive fetched from the internet in memory instead of writing it to disk"""
+        self._archive_data = data
+
+    def open_archive(self) -> zipfile.ZipFile:
+        """
+        Open the modpack archive, each call returns its own ZipFile so that threads can read it at the same time.
+        An online archive that isn't in memory (e.g. the manifest was loaded from a download session) is fetched again
+        """
+        if self._archive_data is None and urlsplit(self.archive).scheme in ("http", "https"):
+            response = requests.get(self.archive, headers={"User-Agent": OVERWOLF_UA})
+            response.raise_for_status()
+            self._archive_data = response.content
+        if self._archive_data is not None:
+            return zipfile.ZipFile(io.BytesIO(self._archive_data))
+        return zipfile.ZipFile(self.archive)
 
 
 modloader_uid = {
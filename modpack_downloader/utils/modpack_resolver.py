@@ -1,20 +1,27 @@
+import hashlib
+import io
 import json
 import logging
 import os
+import random
 import re
 import threading
+import time
 import urllib.parse
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
+from typing import Optional
 
-from PyQt6.QtCore import pyqtSlot
 from requests import Session, RequestException
 
 from .constants import *
 from .download_manager import DownloadOptions
+from .files import parse_checksum, safe_rel_path
 from .foreground_task import ForegroundTask
+from .metadata_cache import MetadataCache
 from .modpack_manifest import Modloader, ModpackManifest
-from ..new_download_dialog import InputOptions, ModpackType
+from .input_options import InputOptions, ModpackType
 
 logger = logging.getLogger(os.path.basename(__file__))
 
@@ -26,6 +33,18 @@ FTB_API_HEAD = {
     "Accept": "application/json",
     "User-Agent": OVERWOLF_UA
 }
+MODRINTH_API_HEAD = {
+    "Accept": "application/json",
+    "User-Agent": MODRINTH_UA
+}
+
+# modrinth.index.json dependency -> modloader
+MODRINTH_LOADERS = {
+    "forge": Modloader.FORGE,
+    "neoforge": Modloader.NEOFORGE,
+    "fabric-loader": Modloader.FABRIC,
+    "quilt-loader": Modloader.QUILT
+}
 
 
 class FileType(IntEnum):
@@ -47,23 +66,24 @@ SUBFOLDER = {
 
 
 class ModpackResolver(ForegroundTask):
-    def __init__(self, download_options: InputOptions, session: Session, parent=None):
-        super().__init__(parent)
-        self.setObjectName("ModpackResolverThread")
+    def __init__(self, download_options: InputOptions, session: Session,
+                 metadata_cache: Optional[MetadataCache] = None):
         self.download_options = download_options
         self.session = session
+        self.metadata_cache = metadata_cache
 
-    @pyqtSlot()
     def run(self):
-        threading.current_thread().name = self.objectName()
+        threading.current_thread().name = "ModpackResolverThread"
         self.progress_changed.emit(0, 0)
         match self.download_options.modpack_type:
             case ModpackType.CF_LOCAL:
                 self.local_cf_pack()
             case ModpackType.CF_ONLINE:
-                raise NotImplementedError
+                self.online_cf_pack()
             case ModpackType.FTB:
                 self.ftb_modpack()
+            case ModpackType.MODRINTH:
+                self.modrinth_pack()
 
     @staticmethod
     def _get_file_hash(mod_file: dict) -> str:
@@ -93,13 +113,8 @@ class ModpackResolver(ForegroundTask):
             file_list.append(file_id)
             mod_list.append(modid)
 
-        resp = self.session.post(CF_GET_FILES_URL, json={"fileIds": file_list}, headers=CF_API_HEAD)
-        resp.raise_for_status()
-        file_info = resp.json()["data"]
-
-        resp = self.session.post(CF_GET_MODS_URL, json={"modIds": mod_list}, headers=CF_API_HEAD)
-        resp.raise_for_status()
-        mod_info = resp.json()["data"]
+        file_info, mod_info = self._cf_bulk_get(("cf_file", CF_GET_FILES_URL, "fileIds", file_list, CF_FILE_TTL),
+                                                ("cf_mod", CF_GET_MODS_URL, "modIds", mod_list, CF_MOD_TTL))
 
         for mod_file in mod_info:
             mod_type = FileType(int(mod_file["classId"]))
@@ -109,17 +124,85 @@ class ModpackResolver(ForegroundTask):
 
         return file_info, fileid_type_mapping
 
+    def _cf_post(self, url: str, key: str, ids: list[int]) -> dict[int, dict]:
+        """POST one chunk of a bulk request, retrying with exponential backoff on network and server errors"""
+        for attempt in range(CF_RETRIES):
+            try:
+                resp = self.session.post(url, json={key: ids}, headers=CF_API_HEAD)
+                resp.raise_for_status()
+                return {item["id"]: item for item in resp.json()["data"]}
+            except RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                if attempt == CF_RETRIES - 1 or (status is not None and status < 500 and status != 429):
+                    raise
+                delay = CF_RETRY_BACKOFF * 2 ** attempt * (1 + random.random())
+                logger.warning(f"Curseforge api request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _cf_bulk_get(self, *queries: tuple[str, str, str, list[int], float]) -> list[list[dict]]:
+        """
+        Get curseforge objects by id, only ids that are not cached (or expired) are requested.
+        Requests are split into chunks that are sent concurrently, expired entries are used for chunks that failed.
+        @param queries: (cache kind, bulk api url, json key, ids, ttl) tuples
+        @return: objects found for each query
+        """
+        objects = []
+        chunks = []
+        with ThreadPoolExecutor(max_workers=CF_BULK_WORKERS, thread_name_prefix="CurseforgeApiThread") as pool:
+            for kind, url, key, ids, ttl in queries:
+                cached = self.metadata_cache.get_objects(kind, ids, ttl) if self.metadata_cache else {}
+                missing = [object_id for object_id in dict.fromkeys(ids) if object_id not in cached]
+                logger.info(f"{len(cached)}/{len(cached) + len(missing)} {kind} entries found in metadata cache")
+                objects.append(cached)
+                for i in range(0, len(missing), CF_BULK_CHUNK_SIZE):
+                    chunk = missing[i:i + CF_BULK_CHUNK_SIZE]
+                    chunks.append((cached, kind, chunk, pool.submit(self._cf_post, url, key, chunk)))
+
+            for cached, kind, chunk, future in chunks:
+                try:
+                    fetched = future.result()
+                except RequestException:
+                    stale = self.metadata_cache.get_objects(kind, chunk) if self.metadata_cache else {}
+                    if len(stale) < len(chunk):
+                        raise
+                    logger.warning(f"Curseforge api unreachable, using expired {kind} entries")
+                    fetched = stale
+                else:
+                    if self.metadata_cache:
+                        self.metadata_cache.put_objects(kind, fetched)
+                cached.update(fetched)
+
+        return [[cached[object_id] for object_id in dict.fromkeys(query[3]) if object_id in cached]
+                for cached, query in zip(objects, queries)]
+
+    def _cached_get(self, url: str, headers: dict) -> dict:
+        """GET a json document, revalidating the cached copy with its ETag"""
+        cached = self.metadata_cache.get_response(url) if self.metadata_cache else None
+        if cached is not None and cached[0]:
+            headers = {**headers, "If-None-Match": cached[0]}
+        try:
+            resp = self.session.get(url, headers=headers)
+        except RequestException:
+            if cached is None:
+                raise
+            logger.warning(f"{url} unreachable, using cached response")
+            return cached[1]
+
+        if resp.status_code == 304 and cached is not None:
+            return cached[1]
+        data = resp.json()
+        if resp.ok and self.metadata_cache:
+            self.metadata_cache.put_response(url, resp.headers.get("ETag"), data)
+        return data
+
     def _ftb_manifest(self) -> tuple[dict, dict]:
         self.status.emit("Fetching modpack manifest")
-        modpack_mf_resp = self.session.get(FTB_MODPACK_MF_URL.format(self.download_options.modpack_id),
-                                           headers=FTB_API_HEAD)
-        modpack_mf = modpack_mf_resp.json()
+        modpack_mf = self._cached_get(FTB_MODPACK_MF_URL.format(self.download_options.modpack_id), FTB_API_HEAD)
         self.progress_changed.emit(1, 2)
         self.status.emit("Fetching version manifest")
-        version_mf_resp = self.session.get(
+        version_mf = self._cached_get(
             FTB_VERSION_MF_URL.format(self.download_options.modpack_id, self.download_options.version_id),
-            headers=FTB_API_HEAD)
-        version_mf = version_mf_resp.json()
+            FTB_API_HEAD)
         self.progress_changed.emit(2, 2)
         return modpack_mf, version_mf
 
@@ -160,8 +243,11 @@ class ModpackResolver(ForegroundTask):
                 icon_url = art["url"]
                 break
 
-        folder_name = re.sub(r"[\\/:*?\"<>|]", "", name)  # remove invalid chars
-        minecraft_dir = os.path.join(self.download_options.save_dir, folder_name)
+        if self.download_options.update_instance:
+            minecraft_dir = self.download_options.save_dir
+        else:
+            folder_name = re.sub(r"[\\/:*?\"<>|]", "", name)  # remove invalid chars
+            minecraft_dir = os.path.join(self.download_options.save_dir, folder_name)
 
         os.makedirs(minecraft_dir, exist_ok=True)
 
@@ -182,7 +268,8 @@ class ModpackResolver(ForegroundTask):
             task = DownloadOptions(url=file["url"],
                                    dir=out_dir,
                                    out=file["name"],
-                                   checksum=f"sha-1={file['sha1']}")
+                                   checksum=f"sha-1={file['sha1']}",
+                                   size=file["size"])
 
             task_list.append(task)
 
@@ -197,34 +284,123 @@ class ModpackResolver(ForegroundTask):
     def search_modpack_icon(self, name: str, modpack_id: int):
         pass
 
-    def local_cf_pack(self):
+    def _load_cf_api_key(self) -> bool:
         api_key = os.environ.get("CF_API_KEY")
         if api_key is None:
             self.failed.emit("Curseforge API key not found")
-            return
-
+            return False
         CF_API_HEAD.update({"x-api-key": api_key})
+        return True
 
-        archive_name = os.path.basename(self.download_options.local_modpack_file)
-        extract_dir = os.path.join(self.download_options.save_dir, os.path.splitext(archive_name)[0])
-        minecraft_dir = os.path.join(extract_dir, "overrides")
+    @staticmethod
+    def _read_cf_manifest(archive: zipfile.ZipFile) -> dict:
+        with archive.open("manifest.json") as mf:
+            return json.load(mf)
+
+    def local_cf_pack(self):
+        if not self._load_cf_api_key():
+            return
 
-        logger.info("Extracting modpack file: %s", archive_name)
-        self.status.emit("Extracting modpack")
-        os.makedirs(extract_dir, exist_ok=True)
+        archive_name = os.path.basename(self.download_options.local_modpack_file)
+        logger.info("Reading modpack file: %s", archive_name)
+        self.status.emit("Reading modpack manifest")
 
         try:
+            # overrides are extracted by OverrideExtractor while the mods are downloading
             with zipfile.ZipFile(self.download_options.local_modpack_file) as f:
-                f.extractall(extract_dir)
-
-            with open(os.path.join(extract_dir, "manifest.json")) as f:
-                manifest = json.load(f)
+                manifest = self._read_cf_manifest(f)
 
-        except (IOError, zipfile.BadZipFile, json.JSONDecodeError) as e:
+        except (IOError, KeyError, zipfile.BadZipFile, json.JSONDecodeError) as e:
             logger.error("Failed to resolve modpack", exc_info=e)
             self.failed.emit("Failed to read manifest, the modpack might be broken")
             return
 
+        self._cf_pack(manifest, os.path.splitext(archive_name)[0],
+                      os.path.abspath(self.download_options.local_modpack_file))
+
+    def _cf_project_id(self, project: str) -> int:
+        """Curseforge project id of a modpack given by id or slug, slugs are looked up once a week"""
+        if project.isdigit():
+            return int(project)
+        url = f"{CF_SEARCH_MODS_URL}?" + urllib.parse.urlencode(
+            {"gameId": CF_GAME_ID, "classId": CF_MODPACK_CLASS_ID, "slug": project})
+        cached = self.metadata_cache.get_response(url, CF_MOD_TTL) if self.metadata_cache else None
+        if cached is not None:
+            data = cached[1]
+        else:
+            resp = self.session.get(url, headers=CF_API_HEAD)
+            resp.raise_for_status()
+            data = resp.json()
+            if self.metadata_cache:
+                self.metadata_cache.put_response(url, resp.headers.get("ETag"), data)
+        if not data["data"]:
+            raise KeyError(f"no modpack with slug {project}")
+        return data["data"][0]["id"]
+
+    def _fetch_archive(self, url: str, checksum: Optional[str]) -> bytes:
+        """Download a modpack archive into memory, verifying its checksum"""
+        buffer = io.BytesIO()
+        with self.session.get(url, headers={"User-Agent": OVERWOLF_UA}, stream=True) as resp:
+            resp.raise_for_status()
+            total = int(resp.headers.get("Content-Length", 0))
+            for chunk in resp.iter_content(1 << 16):
+                buffer.write(chunk)
+                if total:
+                    self.progress_changed.emit(buffer.tell() >> 10, total >> 10)
+        data = buffer.getvalue()
+        if checksum:
+            algo, value = parse_checksum(checksum)
+            if hashlib.new(algo.replace("-", ""), data).hexdigest() != value:
+                raise ValueError(f"checksum of {url} doesn't match")
+        return data
+
+    def online_cf_pack(self):
+        if not self._load_cf_api_key():
+            return
+
+        try:
+            self.status.emit("Looking up modpack")
+            project_id = self._cf_project_id(self.download_options.project.strip())
+            file_id = self.download_options.version_id
+            if not file_id:
+                [project] = self._cf_bulk_get(("cf_mod", CF_GET_MODS_URL, "modIds", [project_id], CF_MOD_TTL))
+                if not project:
+                    raise KeyError(f"project {project_id} not found")
+                file_id = project[0]["mainFileId"]
+            [pack_file] = self._cf_bulk_get(("cf_file", CF_GET_FILES_URL, "fileIds", [file_id], CF_FILE_TTL))
+            if not pack_file or pack_file[0]["modId"] != project_id:
+                raise KeyError(f"file {file_id} of project {project_id} not found")
+            pack_file = pack_file[0]
+            if not pack_file.get("downloadUrl"):
+                self.failed.emit("The author of this modpack doesn't allow downloading it with third-party tools")
+                return
+
+            logger.info(f"Downloading modpack file: {pack_file['fileName']}")
+            self.status.emit("Downloading modpack")
+            data = self._fetch_archive(pack_file["downloadUrl"], self._get_file_hash(pack_file))
+            with zipfile.ZipFile(io.BytesIO(data)) as f:
+                manifest = self._read_cf_manifest(f)
+
+        except (KeyError, ValueError, RequestException, zipfile.BadZipFile) as e:
+            logger.error("Failed to resolve modpack", exc_info=e)
+            self.failed.emit(f"Failed to download modpack: {e}")
+            return
+
+        self._cf_pack(manifest, os.path.splitext(pack_file["fileName"])[0], pack_file["downloadUrl"], data)
+
+    def _cf_pack(self, manifest: dict, folder_name: str, archive: str, archive_data: Optional[bytes] = None):
+        """
+        Resolve the files of a curseforge manifest
+        @param folder_name: folder created in the save dir, unless updating an instance
+        @param archive: path or url of the modpack archive
+        @param archive_data: content of an archive downloaded into memory
+        """
+        if self.download_options.update_instance:
+            minecraft_dir = self.download_options.save_dir
+        else:
+            minecraft_dir = os.path.join(self.download_options.save_dir, folder_name, "overrides")
+        os.makedirs(minecraft_dir, exist_ok=True)
+
         try:
             assert manifest["manifestType"] == "minecraftModpack", "Not a minecraft modpack"
             name = manifest["name"]
@@ -243,12 +419,16 @@ class ModpackResolver(ForegroundTask):
                 out_dir = os.path.abspath(os.path.join(minecraft_dir, subdir))
 
                 task_list.append(DownloadOptions(url=mod_file["downloadUrl"], dir=out_dir,
-                                                 out=mod_file["fileName"], checksum=hash_arg))
+                                                 out=mod_file["fileName"], checksum=hash_arg,
+                                                 size=mod_file.get("fileLength", 0)))
 
             modpack_info = ModpackManifest(name=name, version=version, modlist=task_list,
                                            minecraft_version=mc_version, modloader=modloader,
                                            modloader_version=modloader_version,
-                                           minecraft_dir=minecraft_dir, icon=None)
+                                           minecraft_dir=minecraft_dir, icon=None,
+                                           archive=archive, overrides_dir=manifest.get("overrides", "overrides"))
+            if archive_data is not None:
+                modpack_info.keep_archive(archive_data)
 
             self.complete.emit(modpack_info)
 
@@ -259,3 +439,91 @@ class ModpackResolver(ForegroundTask):
         except Exception as e:
             logger.error("Unknown error resolving modpack files", exc_info=e)
             self.failed.emit("Failed to resolve modpack")
+
+    def _modrinth_version(self, project: str, version_id: str) -> dict:
+        """Modrinth version of a modpack, the latest one if version_id is empty"""
+        if version_id:
+            return self._cached_get(MODRINTH_VERSION_URL.format(urllib.parse.quote(version_id)), MODRINTH_API_HEAD)
+        versions = self._cached_get(MODRINTH_PROJECT_VERSIONS_URL.format(urllib.parse.quote(project)),
+                                    MODRINTH_API_HEAD)
+        if not isinstance(versions, list) or not versions:
+            raise KeyError(f"no versions found for {project}")
+        return versions[0]
+
+    @staticmethod
+    def _read_modrinth_index(archive: zipfile.ZipFile) -> dict:
+        with archive.open("modrinth.index.json") as mf:
+            return json.load(mf)
+
+    def modrinth_pack(self):
+        """Resolve a .mrpack file or a modrinth project version, the index lists every file with its hashes"""
+        options = self.download_options
+        archive_data = None
+        try:
+            if options.local_modpack_file:
+                archive = os.path.abspath(options.local_modpack_file)
+                logger.info("Reading modpack file: %s", os.path.basename(archive))
+                self.status.emit("Reading modpack manifest")
+                with zipfile.ZipFile(archive) as f:
+                    index = self._read_modrinth_index(f)
+            else:
+                self.status.emit("Looking up modpack")
+                version = self._modrinth_version(options.project.strip(), options.version.strip())
+                pack_file = next((file for file in version["files"] if file.get("primary")), version["files"][0])
+                logger.info(f"Downloading modpack file: {pack_file['filename']}")
+                self.status.emit("Downloading modpack")
+                archive = pack_file["url"]
+                archive_data = self._fetch_archive(archive, f"sha-1={pack_file['hashes']['sha1']}")
+                with zipfile.ZipFile(io.BytesIO(archive_data)) as f:
+                    index = self._read_modrinth_index(f)
+
+        except (IOError, KeyError, IndexError, ValueError, zipfile.BadZipFile) as e:
+            logger.error("Failed to resolve modpack", exc_info=e)
+            self.failed.emit(f"Failed to read modpack: {e}")
+            return
+
+        try:
+            modpack_info = self._modrinth_manifest(index, archive)
+        except (KeyError, IndexError, ValueError) as e:
+            logger.error("Failed to resolve modpack", exc_info=e)
+            self.failed.emit("Manifest file is broken or it's not a minecraft modpack")
+            return
+        if archive_data is not None:
+            modpack_info.keep_archive(archive_data)
+        self.complete.emit(modpack_info)
+
+    def _modrinth_manifest(self, index: dict, archive: str) -> ModpackManifest:
+        if index.get("game") != "minecraft":
+            raise ValueError(f"unsupported game: {index.get('game')}")
+        name = index["name"]
+        dependencies = index["dependencies"]
+        loader = next((key for key in dependencies if key in MODRINTH_LOADERS), None)
+        if loader is None:
+            raise ValueError(f"unsupported modloader: {', '.join(dependencies)}")
+
+        if self.download_options.update_instance:
+            minecraft_dir = self.download_options.save_dir
+        else:
+            minecraft_dir = os.path.join(self.download_options.save_dir, re.sub(r"[\\/:*?\"<>|]", "", name))
+        os.makedirs(minecraft_dir, exist_ok=True)
+
+        task_list = []
+        for file in index["files"]:
+            if file.get("env", {}).get("client") == "unsupported":
+                continue
+            if not safe_rel_path(file["path"]):
+                logger.warning(f"Skipping suspicious file path {file['path']}")
+                continue
+            path = os.path.abspath(os.path.join(minecraft_dir, file["path"]))
+            hashes = file["hashes"]
+            # sha1 like the other platforms, so that the mod cache shares files between Modrinth and CF/FTB packs
+            checksum = f"sha-1={hashes['sha1']}" if "sha1" in hashes else f"sha-512={hashes['sha512']}"
+            url, *mirrors = file["downloads"]
+            task_list.append(DownloadOptions(url=url, mirrors=mirrors, dir=os.path.dirname(path),
+                                             out=os.path.basename(path), checksum=checksum,
+                                             size=file.get("fileSize", 0)))
+
+        return ModpackManifest(name=name, version=index["versionId"], modlist=task_list,
+                               minecraft_version=dependencies["minecraft"], modloader=MODRINTH_LOADERS[loader],
+                               modloader_version=dependencies[loader], minecraft_dir=minecraft_dir,
+                               archive=archive, overrides_dir="overrides", client_overrides_dir="client-overrides")
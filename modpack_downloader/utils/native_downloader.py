@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import importlib.util
+import itertools
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .constants import DOWNLOAD_WINDOW
+from .download_manager import DownloadManager, DownloadOptions
+from .files import parse_checksum
+from .mod_cache import ModCache
+from .retry_scheduler import RetryScheduler
+from .signals import Signal
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+__all__ = ["NATIVE_AVAILABLE", "NativeDownloader", "NativeDownloadManager"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+# the native engine is optional, it needs httpx (and h2 for HTTP/2)
+NATIVE_AVAILABLE = httpx is not None
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# errors that fail a download, anything else is a bug
+DOWNLOAD_ERRORS = (httpx.HTTPError, httpx.InvalidURL, OSError, ValueError) if httpx is not None else ()
+
+
+@dataclass
+class NativeTask:
+    gid: str
+    url: str
+    dir: str
+    out: str = ""
+    checksum: str = ""
+    # urls of the same file tried in order when url fails
+    mirrors: list[str] = field(default_factory=list)
+    status: str = "waiting"
+    total_length: int = 0
+    completed_length: int = 0
+    download_speed: int = 0
+    error_message: str = ""
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.dir, self.out or os.path.basename(self.url))
+
+    @property
+    def uris(self) -> list[str]:
+        return [self.url, *self.mirrors]
+
+    @property
+    def options(self) -> dict:
+        return {"dir": self.dir, "out": self.out, "checksum": self.checksum}
+
+    def status_dict(self, keys: Optional[list] = None) -> dict:
+        """Status in the format of aria2.tellStatus, numbers are strings like in aria2"""
+        status = {
+            "gid": self.gid,
+            "status": self.status,
+            "totalLength": str(self.total_length),
+            "completedLength": str(self.completed_length),
+            "downloadSpeed": str(self.download_speed),
+            "errorMessage": self.error_message,
+            "files": [{"path": self.path, "uris": [{"uri": uri, "status": "used"} for uri in self.uris]}],
+        }
+        if keys:
+            return {key: status[key] for key in keys if key in status}
+        return status
+
+
+class NativeDownloader(threading.Thread):
+    """
+    In-process download engine built on asyncio and httpx, an alternative to an aria2 subprocess.
+    Implements the parts of Aria2Client and Aria2EventListener used by the download manager: tasks are queued and
+    restarted by gid, polled with tell_active() and report state changes with the same signals.
+    Connections are pooled per host and kept alive (multiplexed over HTTP/2 if h2 is installed). Files are streamed
+    to a .part file in fixed size chunks and hashed on the way, so memory use doesn't depend on the file size, and
+    only renamed into place once the checksum matches.
+    """
+    onDownloadStart = Signal(str)
+    onDownloadPause = Signal(str)
+    onDownloadStop = Signal(str)
+    onDownloadComplete = Signal(str)
+    onDownloadError = Signal(str)
+
+    CHUNK_SIZE = 1 << 16
+    SPEED_INTERVAL = 0.5
+    START_TIMEOUT = 5
+
+    def __init__(self, max_concurrent: int = 64, timeout: float = 30, user_agent: Optional[str] = None,
+                 http2: bool = True):
+        """
+        @param max_concurrent: downloads running at the same time, the others wait in the queue
+        @param timeout: connect and read timeout in seconds
+        @param user_agent: User-Agent header of every request
+        @param http2: use HTTP/2 when the server supports it and h2 is installed
+        """
+        if httpx is None:
+            raise ImportError("the native download engine requires httpx, install it with pip install httpx[http2]")
+        super().__init__(name="NativeDownloaderThread", daemon=True)
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._gids = itertools.count(1)
+        self._tasks: dict[str, NativeTask] = {}
+        # asyncio tasks of queued and running downloads
+        self._jobs: dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        headers = {"User-Agent": self.user_agent} if self.user_agent else None
+        limits = httpx.Limits(max_connections=self.max_concurrent, max_keepalive_connections=self.max_concurrent)
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._stop_event = asyncio.Event()
+        async with httpx.AsyncClient(http2=self.http2, limits=limits, headers=headers, follow_redirects=True,
+                                     timeout=httpx.Timeout(self.timeout)) as self._http:
+            self.loop = asyncio.get_running_loop()
+            self._ready.set()
+            logger.info(f"Native download engine started (HTTP/2 {'enabled' if self.http2 else 'disabled'})")
+            if not self._stopping.is_set():
+                await self._stop_event.wait()
+
+            jobs = list(self._jobs.values())
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+        logger.info("Native download engine stopped")
+
+    def _start(self, gid: str):
+        self._jobs[gid] = asyncio.create_task(self._download(self._tasks[gid]))
+
+    async def _download(self, task: NativeTask):
+        try:
+            async with self._slots:
+                task.status = "active"
+                self.onDownloadStart.emit(task.gid)
+                try:
+                    await self._fetch_any(task)
+                except DOWNLOAD_ERRORS as e:
+                    logger.error(f"{task.uris[-1]} download failed: {e}")
+                    task.status = "error"
+                    task.error_message = str(e) or type(e).__name__
+                    self.onDownloadError.emit(task.gid)
+                else:
+                    task.status = "complete"
+                    self.onDownloadComplete.emit(task.gid)
+                finally:
+                    task.download_speed = 0
+        finally:
+            self._jobs.pop(task.gid, None)
+
+    async def _fetch_any(self, task: NativeTask):
+        """Download a task from its url, falling back to its mirrors in order"""
+        *urls, last = task.uris
+        for url in urls:
+            try:
+                return await self._fetch(task, url)
+            except DOWNLOAD_ERRORS as e:
+                logger.warning(f"{url} download failed: {e}, trying the next mirror")
+        await self._fetch(task, last)
+
+    async def _fetch(self, task: NativeTask, url: str):
+        digest, expected = None, ""
+        if task.checksum:
+            algo, expected = parse_checksum(task.checksum)
+            digest = hashlib.new(algo.replace("-", ""))
+
+        os.makedirs(task.dir, exist_ok=True)
+        part = task.path + ".part"
+        async with self._http.stream("GET", url) as response:
+            response.raise_for_status()
+            task.total_length = int(response.headers.get("Content-Length", 0))
+            task.completed_length = 0
+            sample_time, sample_length = time.monotonic(), 0
+            # chunks are written as they arrive, small blocking writes to the page cache cost less than
+            # handing every chunk to a thread
+            with open(part, "wb") as f:
+                async for chunk in response.aiter_bytes(self.CHUNK_SIZE):
+                    f.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    task.completed_length += len(chunk)
+                    now = time.monotonic()
+                    if now - sample_time >= self.SPEED_INTERVAL:
+                        task.download_speed = int((task.completed_length - sample_length) / (now - sample_time))
+                        sample_time, sample_length = now, task.completed_length
+
+        if digest is not None and digest.hexdigest() != expected:
+            os.remove(part)
+            raise ValueError(f"checksum mismatch, expected {expected}, got {digest.hexdigest()}")
+        task.total_length = task.completed_length
+        os.replace(part, task.path)
+
+    def _submit(self, gids: list[str]):
+        if not self._ready.wait(self.START_TIMEOUT) or self._stopping.is_set():
+            raise ConnectionError("native download engine is not running")
+        for gid in gids:
+            self.loop.call_soon_threadsafe(self._start, gid)
+
+    def add_uris(self, tasks: list[tuple[list[str], dict]]) -> list[str]:
+        """
+        Queue files, safe to call from any thread
+        @param tasks: (urls, options) pairs like aria2.addUri: the urls of one file, tried in order, and the aria2
+        options dir, out and checksum
+        @return: gids of the new tasks
+        """
+        gids = []
+        with self._lock:
+            for (url, *mirrors), options in tasks:
+                gid = f"{next(self._gids):016x}"
+                # named after the first url, whichever url it ends up downloaded from
+                out = options.get("out") or os.path.basename(url)
+                self._tasks[gid] = NativeTask(gid=gid, url=url, mirrors=mirrors, dir=options.get("dir", "."), out=out,
+                                              checksum=options.get("checksum", ""))
+                gids.append(gid)
+        self._submit(gids)
+        return gids
+
+    def add_uri(self, uris: list, options: Optional[dict] = None) -> str:
+        return self.add_uris([(uris, options or {})])[0]
+
+    def _snapshot(self) -> list[NativeTask]:
+        with self._lock:
+            return list(self._tasks.values())
+
+    def tell_status(self, gid: str, keys: Optional[list] = None) -> dict:
+        with self._lock:
+            task = self._tasks.get(gid)
+        if task is None:
+            raise KeyError(f"unknown gid {gid}")
+        return task.status_dict(keys)
+
+    def tell_active(self, keys: Optional[list] = None) -> list[dict]:
+        return [task.status_dict(keys) for task in self._snapshot() if task.status == "active"]
+
+    def get_all_downloads(self, keys: Optional[list] = None, page_size: Optional[int] = None) -> list[dict]:
+        return [task.status_dict(keys) for task in self._snapshot()]
+
+    def purge_download_result(self):
+        """Forget completed, failed and removed tasks"""
+        with self._lock:
+            self._tasks = {gid: task for gid, task in self._tasks.items()
+                           if task.status not in ("complete", "error", "removed")}
+
+    def restart_downloads(self, tasks: dict[str, str]) -> dict[str, str]:
+        """
+        Re-add failed tasks under new gids, unknown gids and tasks that didn't fail are skipped and left as they are
+        @param tasks: gid -> uri of the failed tasks
+        @return: old gid -> new gid mapping of the restarted tasks
+        """
+        restarted = {}
+        with self._lock:
+            for gid, uri in tasks.items():
+                task = self._tasks.get(gid)
+                if task is None or task.status != "error":
+                    logger.error(f"Cannot restart {gid}, only failed tasks can be restarted")
+                    continue
+                del self._tasks[gid]
+                new_gid = f"{next(self._gids):016x}"
+                # the mirrors are kept, a retry from a fallback url can still fall back to them
+                mirrors = [mirror for mirror in task.uris if mirror != uri]
+                self._tasks[new_gid] = NativeTask(gid=new_gid, url=uri, mirrors=mirrors, **task.options)
+                restarted[gid] = new_gid
+        self._submit(list(restarted.values()))
+        return restarted
+
+    def retry_all(self) -> dict[str, str]:
+        """Restart all failed tasks from their last url"""
+        return self.restart_downloads({task.gid: task.url for task in self._snapshot() if task.status == "error"})
+
+    def shutdown(self):
+        """Cancel running downloads and stop the engine, partial files are left as .part files"""
+        self._stopping.set()
+        if self._ready.is_set():
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    def wait(self, timeout: Optional[float] = None):
+        if self.is_alive():
+            self.join(timeout)
+
+
+class NativeDownloadManager(DownloadManager):
+    """DownloadManager driving a NativeDownloader instead of aria2, the downloader is both client and listener"""
+
+    def __init__(self, downloader: NativeDownloader, mod_cache: Optional[ModCache] = None,
+                 retry_scheduler: Optional[RetryScheduler] = None, window: int = DOWNLOAD_WINDOW):
+        super().__init__(downloader, downloader, mod_cache, retry_scheduler, window=window)
+
+    def _add_tasks(self, tasks: list[DownloadOptions]) -> list:
+        return self.client.add_uris([([task.url, *task.mirrors], task.aria2_options()) for task in tasks])
+
+    def _fetch_error_message(self, gid: str):
+        try:
+            self.task_list.update_all([self.client.tell_status(gid, ["gid", "errorMessage"])])
+        except KeyError:
+            pass
+
+    def _restart_failed(self) -> Optional[dict[str, str]]:
+        try:
+            return self.client.retry_all()
+        except ConnectionError as e:
+            logger.error(f"Failed to restart failed tasks: {e}")
+            return None
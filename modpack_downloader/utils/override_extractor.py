@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+from .constants import EXTRACT_WORKERS
+from .files import archive_entries
+from .foreground_task import ForegroundTask
+from .hash_index import HashIndex
+from .instance_record import InstanceRecord
+from .modpack_manifest import ModpackManifest
+
+__all__ = ["OverrideExtractor"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+CHUNK_SIZE = 1 << 20
+# smaller files are written in one go anyway, reserving their space first is only overhead
+PREALLOCATE_MIN_SIZE = 1 << 20
+
+
+def _preallocate(f, size: int):
+    """Reserve the disk space of a file up front, so it isn't grown chunk by chunk (no-op where unsupported)"""
+    if size >= PREALLOCATE_MIN_SIZE and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass
+
+
+class OverrideExtractor(ForegroundTask):
+    """
+    Extract the overrides of a modpack archive into its minecraft dir, meant to run while the mods are downloading.
+    Entries are extracted by a pool of threads, each reading the archive through its own ZipFile. Files already on
+    disk with the size and CRC of their entry are not written again, files the user modified since the last install
+    are left untouched. Files on disk are read at most once, and not at all if the hash index knows them already.
+    The checksums of extracted files are stored in modpack_info.overrides
+    """
+
+    def __init__(self, modpack_info: ModpackManifest, hash_index: Optional[HashIndex] = None,
+                 workers: int = EXTRACT_WORKERS):
+        """
+        @param hash_index: hash index of the minecraft dir, checked files and extracted files are added to it
+        @param workers: number of extracting threads
+        """
+        self.modpack_info = modpack_info
+        self.hash_index = hash_index
+        self.workers = workers
+        self._record: Optional[InstanceRecord] = None
+        self._local = threading.local()
+        self._archives: list[zipfile.ZipFile] = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        threading.current_thread().name = "OverrideExtractorThread"
+        modpack = self.modpack_info
+        self._record = InstanceRecord.load(modpack.minecraft_dir)
+        logger.info(f"Extracting overrides of {modpack.name}")
+        self.status.emit("Extracting overrides")
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="OverrideWorkerThread")
+        try:
+            with modpack.open_archive() as archive:
+                entries = archive_entries(archive, *modpack.override_dirs)
+
+            futures = {pool.submit(self._extract, rel_path, info): (rel_path, info)
+                       for rel_path, info in entries.items()}
+
+            # progress in KiB, rounded up so that small overrides don't show up as 0/0
+            total = sum(info.file_size for _, info in futures.values())
+            done = 0
+            self.progress_changed.emit(0, (total + 1023) >> 10)
+            for future in as_completed(futures):
+                rel_path, info = futures[future]
+                modpack.overrides[rel_path] = future.result()
+                done += info.file_size
+                self.progress_changed.emit((done + 1023) >> 10, (total + 1023) >> 10)
+
+        except (OSError, sqlite3.Error, zipfile.BadZipFile) as e:
+            logger.error("Failed to extract overrides", exc_info=e)
+            self.failed.emit(f"Failed to extract overrides: {e}")
+            return
+        finally:
+            pool.shutdown(cancel_futures=True)
+            for archive in self._archives:
+                archive.close()
+            self._archives.clear()
+
+        logger.info(f"Extracted {len(modpack.overrides)} overrides of {modpack.name}")
+        self.complete.emit(modpack)
+
+    def _archive(self) -> zipfile.ZipFile:
+        """ZipFile of the current thread, reads through a shared ZipFile would be serialized"""
+        archive = getattr(self._local, "archive", None)
+        if archive is None:
+            archive = self._local.archive = self.modpack_info.open_archive()
+            with self._lock:
+                self._archives.append(archive)
+        return archive
+
+    def _extract(self, rel_path: str, info: zipfile.ZipInfo) -> str:
+        """
+        Extract a zip entry unless the file on disk already matches it or the user modified it
+        @return: checksum of the file
+        """
+        path = os.path.join(self.modpack_info.minecraft_dir, rel_path)
+        digests = self._digests(info, path)
+        if digests is not None and digests[0] == info.CRC:
+            return digests[1]
+        # the sha1 of the file is in the hash index now, checking it against the record doesn't read the file again
+        record = self._record
+        if record is not None and record.is_user_modified(self.modpack_info.minecraft_dir, rel_path, self.hash_index):
+            logger.info(f"Keeping user modified file {rel_path}")
+            return record.files[rel_path].checksum
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the file may be a hardlink into the mod cache or another instance, writing it in place would change those too
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        h = hashlib.sha1()
+        with self._archive().open(info) as src, open(path, "wb") as dst:
+            _preallocate(dst, info.file_size)
+            while chunk := src.read(CHUNK_SIZE):
+                h.update(chunk)
+                dst.write(chunk)
+        checksum = f"sha-1={h.hexdigest()}"
+        if self.hash_index is not None:
+            self.hash_index.record(path, checksum, f"crc32={info.CRC:08x}")
+        return checksum
+
+    def _digests(self, info: zipfile.ZipInfo, path: str) -> Optional[tuple[int, str]]:
+        """
+        CRC and checksum of the file at path, taken from the hash index if it is unchanged since it was indexed
+        @return: None if there is no file of the size of the zip entry
+        """
+        try:
+            if os.path.getsize(path) != info.file_size:
+                return None
+            index = self.hash_index
+            if index is not None:
+                crc, sha1 = index.cached(path, "crc32"), index.cached(path, "sha-1")
+                if crc is not None and sha1 is not None:
+                    return int(crc, 16), f"sha-1={sha1}"
+
+            crc, h = 0, hashlib.sha1()
+            with open(path, "rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    crc = zlib.crc32(chunk, crc)
+                    h.update(chunk)
+            checksum = f"sha-1={h.hexdigest()}"
+            if index is not None:
+                index.record(path, checksum, f"crc32={crc:08x}")
+        except OSError:
+            return None
+        return crc, checksum
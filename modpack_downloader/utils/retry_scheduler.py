@@ -0,0 +1,136 @@
+import logging
+import os
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+from .constants import (DOWNLOAD_MIRRORS, DOWNLOAD_RETRIES, DOWNLOAD_RETRIES_PER_HOST, DOWNLOAD_RETRY_DELAY,
+                        DOWNLOAD_RETRY_MAX_DELAY)
+
+__all__ = ["RetryScheduler", "load_mirrors"]
+
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+def load_mirrors() -> dict[str, list[str]]:
+    """Default mirrors merged with the ones from the MODPACK_DOWNLOADER_MIRRORS environment variable"""
+    mirrors = {host: list(alternates) for host, alternates in DOWNLOAD_MIRRORS.items()}
+    for entry in os.environ.get("MODPACK_DOWNLOADER_MIRRORS", "").split(";"):
+        host, _, alternates = entry.partition("=")
+        if host.strip():
+            mirrors.setdefault(host.strip(), []).extend(a.strip() for a in alternates.split(",") if a.strip())
+    return mirrors
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+@dataclass
+class HostState:
+    # exponentially weighted failure rate, 0 = healthy, close to 1 = every recent download failed
+    failure_rate: float = 0.0
+    retries: int = 0
+    waiting: deque = field(default_factory=deque)
+
+
+class RetryScheduler:
+    """
+    Decides when and from where failed downloads are retried.
+    Keeps a failure rate per host: retries back off exponentially with jitter (longer for unhealthy hosts), only a few
+    retries run against the same host at once, and a url whose host keeps failing is swapped for a mirror.
+    """
+    # weight of the latest result in the failure rate
+    DECAY = 0.3
+
+    def __init__(self, max_attempts: int = DOWNLOAD_RETRIES, base_delay: float = DOWNLOAD_RETRY_DELAY,
+                 max_delay: float = DOWNLOAD_RETRY_MAX_DELAY, max_per_host: int = DOWNLOAD_RETRIES_PER_HOST,
+                 mirrors: Optional[dict[str, list[str]]] = None):
+        """
+        @param max_attempts: attempts of a file before giving up, including the first one
+        @param base_delay: delay before the first retry in seconds, doubled on every attempt
+        @param max_delay: upper bound of the delay
+        @param max_per_host: retries allowed to run at the same time against a host
+        @param mirrors: host -> alternate hosts, defaults to load_mirrors()
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_per_host = max_per_host
+        self.mirrors = load_mirrors() if mirrors is None else mirrors
+        self.hosts: dict[str, HostState] = {}
+
+    def _state(self, url: str) -> HostState:
+        return self.hosts.setdefault(_host(url), HostState())
+
+    def candidates(self, url: str) -> list[str]:
+        """The url followed by the same url on every mirror of its host"""
+        parts = urlsplit(url)
+        urls = [url]
+        for mirror in self.mirrors.get(parts.hostname or "", []):
+            netloc = mirror if parts.port is None or ":" in mirror else f"{mirror}:{parts.port}"
+            urls.append(parts._replace(netloc=netloc).geturl())
+        return urls
+
+    def succeeded(self, url: str):
+        state = self._state(url)
+        state.failure_rate *= 1 - self.DECAY
+
+    def failed(self, url: str, attempt: int, original_url: Optional[str] = None) -> Optional[tuple[float, str]]:
+        """
+        Record a failed attempt
+        @param url: url that failed
+        @param attempt: number of attempts made so far
+        @param original_url: url from the manifest, used to look up mirrors
+        @return: (delay, url) of the next attempt, None to give up
+        """
+        state = self._state(url)
+        state.failure_rate = state.failure_rate * (1 - self.DECAY) + self.DECAY
+        if attempt >= self.max_attempts:
+            return None
+
+        # the healthiest of the original url and its mirrors, the current one wins ties
+        candidates = self.candidates(original_url or url)
+        if url in candidates:
+            candidates.remove(url)
+        candidates.insert(0, url)
+        next_url = min(candidates, key=lambda u: self._state(u).failure_rate)
+        if next_url != url:
+            logger.info(f"Switching {url} to {next_url}")
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * (1 + self._state(next_url).failure_rate)
+        # equal jitter, spreads out retries of files that failed together
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay, next_url
+
+    def acquire(self, url: str, item: Any) -> bool:
+        """
+        Take a retry slot of the host of url
+        @param item: queued if the host has no free slot, it is returned by release() once one frees up
+        @return: whether a slot was taken
+        """
+        state = self._state(url)
+        if state.retries < self.max_per_host:
+            state.retries += 1
+            return True
+        state.waiting.append(item)
+        return False
+
+    def release(self, url: str) -> Optional[Any]:
+        """
+        Give back a retry slot
+        @return: the next queued item, which now holds the slot
+        """
+        state = self._state(url)
+        if state.waiting:
+            return state.waiting.popleft()
+        state.retries = max(0, state.retries - 1)
+        return None
+
+    def reset(self):
+        """Forget pending retries, e.g. after every failed task was restarted by hand"""
+        for state in self.hosts.values():
+            state.retries = 0
+            state.waiting.clear()
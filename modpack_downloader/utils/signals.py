@@ -0,0 +1,49 @@
+import threading
+from typing import Callable
+
+__all__ = ["Signal", "BoundSignal"]
+
+
+class BoundSignal:
+    """Per-instance list of slots, slots are called on the thread that emits"""
+
+    def __init__(self):
+        self._slots: list[Callable] = []
+        self._lock = threading.Lock()
+
+    def connect(self, slot: Callable):
+        with self._lock:
+            self._slots.append(slot)
+
+    def disconnect(self, slot: Callable = None):
+        """Disconnect a slot, or every slot if none is given"""
+        with self._lock:
+            if slot is None:
+                self._slots.clear()
+            else:
+                self._slots.remove(slot)
+
+    def emit(self, *args):
+        with self._lock:
+            slots = list(self._slots)
+        for slot in slots:
+            slot(*args)
+
+
+class Signal:
+    """
+    Minimal replacement of pyqtSignal for code that has to run without Qt.
+    Declared as a class attribute, every instance gets its own BoundSignal.
+    """
+
+    def __init__(self, *types):
+        self.types = types
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return instance.__dict__.setdefault(self.name, BoundSignal())
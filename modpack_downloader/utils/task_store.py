@@ -0,0 +1,154 @@
+import os
+import threading
+from array import array
+from typing import Iterable
+
+__all__ = ["STATUSES", "TaskStore"]
+
+# aria2 task statuses, stored as their index
+STATUSES = ("waiting", "active", "paused", "error", "complete", "removed")
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+
+class TaskStore:
+    """
+    State of every task added to aria2, keyed by gid.
+    Stored column by column in preallocated arrays, rows keep their position for the whole session and are updated
+    in place. Changed rows are collected until take_changes() is called.
+    Written by the download manager thread only, rows below len() can be read from any thread.
+    """
+    # fields reported by aria2 as strings, each one has its own column
+    INT_FIELDS = ("totalLength", "completedLength", "downloadSpeed")
+    MIN_GROWTH = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._allocate()
+
+    def _allocate(self):
+        self._size = 0
+        self._gids: list[str] = []
+        self._names: list[str] = []
+        self._status = bytearray()
+        self._columns = {key: array("q") for key in self.INT_FIELDS}
+        # error messages are rare, keep them out of the columns
+        self._errors: dict[int, str] = {}
+        self._index: dict[str, int] = {}
+        self._changed: set[int] = set()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, gid: str) -> bool:
+        return gid in self._index
+
+    def _reserve(self, count: int):
+        """Grow the columns so that count more rows fit"""
+        missing = self._size + count - len(self._status)
+        if missing <= 0:
+            return
+        growth = max(missing, len(self._status), self.MIN_GROWTH)
+        self._status.extend(bytes(growth))
+        for column in self._columns.values():
+            column.frombytes(bytes(growth * column.itemsize))
+
+    def add(self, tasks: Iterable[tuple[str, str]]):
+        """
+        Add tasks that were just queued in aria2
+        @param tasks: (gid, file path) pairs
+        """
+        tasks = list(tasks)
+        with self._lock:
+            self._reserve(len(tasks))
+            for gid, path in tasks:
+                row = self._size
+                self._index[gid] = row
+                self._gids.append(gid)
+                self._names.append(os.path.basename(path))
+                self._changed.add(row)
+                self._size += 1
+
+    def update(self, gid: str, **fields):
+        """Update some fields of a task, unknown gids and fields are ignored"""
+        row = self._index.get(gid)
+        if row is None:
+            return
+
+        changed = False
+        for key, value in fields.items():
+            if key == "status":
+                code = _STATUS_CODES[value]
+                if self._status[row] != code:
+                    self._status[row] = code
+                    changed = True
+            elif key == "errorMessage":
+                if self._errors.get(row, "") != value:
+                    if value:
+                        self._errors[row] = value
+                    else:
+                        del self._errors[row]
+                    changed = True
+            elif key in self._columns:
+                column = self._columns[key]
+                value = int(value)
+                if column[row] != value:
+                    column[row] = value
+                    changed = True
+
+        if changed:
+            with self._lock:
+                self._changed.add(row)
+
+    def update_all(self, statuses: Iterable[dict]):
+        """Update tasks from tellActive/tellStatus results"""
+        for status in statuses:
+            self.update(**status)
+
+    def rename(self, gid: str, new_gid: str):
+        """Follow a task that was restarted under a new gid, it keeps its row"""
+        with self._lock:
+            row = self._index.pop(gid, None)
+            if row is None:
+                return
+            self._index[new_gid] = row
+            self._gids[row] = new_gid
+        self.update(new_gid, status="waiting", errorMessage="", downloadSpeed=0)
+
+    def clear(self):
+        with self._lock:
+            self._allocate()
+
+    def take_changes(self) -> list[int]:
+        """@return: sorted rows changed since the last call"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return sorted(changed)
+
+    def gid(self, row: int) -> str:
+        return self._gids[row]
+
+    def name(self, row: int) -> str:
+        return self._names[row]
+
+    def status(self, row: int) -> str:
+        return STATUSES[self._status[row]]
+
+    def total_length(self, row: int) -> int:
+        return self._columns["totalLength"][row]
+
+    def completed_length(self, row: int) -> int:
+        return self._columns["completedLength"][row]
+
+    def download_speed(self, row: int) -> int:
+        return self._columns["downloadSpeed"][row]
+
+    def error_message(self, row: int) -> str:
+        return self._errors.get(row, "")
+
+    def progress(self, row: int) -> int:
+        if self._status[row] == _STATUS_CODES["complete"]:
+            return 100
+        total = self.total_length(row)
+        if total == 0:
+            return 0
+        return int(self.completed_length(row) / total * 100)